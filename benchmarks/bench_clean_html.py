@@ -0,0 +1,50 @@
+"""
+clean_html microbenchmark: always building a soup (before) vs the tiered
+cleaner (after) on the test corpus.
+
+    python benchmarks/bench_clean_html.py
+"""
+
+import html
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from newsreposter.core.logging import setup_logger  # noqa: E402
+from newsreposter.core.parsers import _clean_html_soup, clean_html  # noqa: E402
+
+CORPUS = Path(__file__).parent.parent / "tests" / "fixtures" / "clean_html_corpus.json"
+
+
+def soup_only_clean_html(text: str) -> str:
+    if not text:
+        return ""
+    return re.sub(r"\s+", " ", _clean_html_soup(html.unescape(text))).strip()
+
+
+def bench(name, func, texts, number):
+    seconds = min(
+        timeit.repeat(lambda: [func(t) for t in texts], number=number, repeat=5)
+    )
+    per_call = seconds / number / len(texts) * 1e6
+    print(f"{name:<22}{per_call:>10.2f} us/call")
+    return per_call
+
+
+def main():
+    setup_logger(logfile=None, filter_logfile=None, level="WARNING")
+    corpus = json.loads(CORPUS.read_text(encoding="utf-8"))
+    plain = [t for t in corpus if not set("<&") & set(html.unescape(t))]
+    for label, texts in (("whole corpus", corpus), ("plain-text titles", plain)):
+        print(f"{label} ({len(texts)} strings)")
+        before = bench("  soup every time", soup_only_clean_html, texts, 200)
+        after = bench("  tiered", clean_html, texts, 200)
+        print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Parse time and peak memory per site: full html.parser tree (before) vs
+declared target regions with html.parser / lxml (after).
+
+Pages are read from PAGES_DIR: `pre_<site>.html` for pre-parser pages and
+`post_<site>.html` for article pages. Use --fetch to save the current
+pre-parser pages and --article site=url to save an article page first.
+
+    python benchmarks/bench_parsers.py bench_pages --fetch --article ria=https://ria.ru/...
+"""
+
+import argparse
+import importlib
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from newsreposter.core import parsers  # noqa: E402
+from newsreposter.core.logging import setup_logger  # noqa: E402
+from newsreposter.core.parsers.post_parsers import parse_html  # noqa: E402
+
+PRE_PARSERS = {"fsb": "FSB_URL", "interfax": "INTERFAX_URL"}
+
+
+def measure(func, repeat: int):
+    func()  # warm up imports and caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def variants(backends):
+    yield "html.parser, full tree", "html.parser", False
+    for backend in backends:
+        yield f"{backend}, regions", backend, True
+
+
+def bench_page(kind: str, site: str, content: bytes, backends, repeat: int):
+    module = importlib.import_module(f"newsreposter.core.parsers.{kind}_parsers.{site}")
+    parse_only = getattr(module, "PARSE_ONLY", None)
+    rows = []
+    for label, backend, strained in variants(backends):
+        parsers.set_html_parser(backend)
+        if kind == "pre":
+            saved = module.PARSE_ONLY
+            module.PARSE_ONLY = parse_only if strained else None
+
+            def func():
+                try:
+                    module.parse_items(content)
+                except RuntimeError:
+                    pass
+
+            try:
+                rows.append((label, *measure(func, repeat)))
+            finally:
+                module.PARSE_ONLY = saved
+        else:
+
+            def func():
+                parse_html(
+                    module.parse,
+                    content,
+                    f"https://{site}.ru/",
+                    parse_only if strained else None,
+                )
+
+            rows.append((label, *measure(func, repeat)))
+    return rows
+
+
+def fetch(pages: Path, pre: bool, articles):
+    for site, attr in PRE_PARSERS.items() if pre else ():
+        module = importlib.import_module(f"newsreposter.core.parsers.pre_parsers.{site}")
+        content = parsers.get_rendered_page(getattr(module, attr))
+        if content:
+            data = content if isinstance(content, bytes) else content.encode("utf-8")
+            (pages / f"pre_{site}.html").write_bytes(data)
+    for article in articles:
+        site, url = article.split("=", 1)
+        content = parsers.get_rendered_page(url)
+        if content:
+            data = content if isinstance(content, bytes) else content.encode("utf-8")
+            (pages / f"post_{site}.html").write_bytes(data)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("pages", type=Path)
+    argparser.add_argument("--fetch", action="store_true")
+    argparser.add_argument("--article", action="append", default=[])
+    argparser.add_argument("--repeat", type=int, default=20)
+    opts = argparser.parse_args()
+
+    setup_logger(logfile=None, filter_logfile=None, level="WARNING")
+    opts.pages.mkdir(parents=True, exist_ok=True)
+    if opts.fetch or opts.article:
+        fetch(opts.pages, opts.fetch, opts.article)
+
+    backends = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+
+        backends.append("lxml")
+    except ImportError:
+        print("lxml is not installed, skipping it")
+
+    print(f"{'page':<24}{'variant':<26}{'time, ms':>10}{'peak, KiB':>12}")
+    for path in sorted(opts.pages.glob("*.html")):
+        kind, _, site = path.stem.partition("_")
+        if kind not in ("pre", "post"):
+            continue
+        content = path.read_bytes()
+        for label, seconds, peak in bench_page(kind, site, content, backends, opts.repeat):
+            print(f"{path.stem:<24}{label:<26}{seconds * 1000:>10.2f}{peak / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,18 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 
 def main():
-    from newsreposter.app import run
+    from newsreposter.app import run, run_filter_worker
+    from newsreposter.core.argparse import args
 
-    logger.opt(colors=True).info("<M>Starting unified app...</M>")
     logger.debug("Python version: {}", sys.version)
     logger.debug("Working directory: {}", Path.cwd())
 
-    asyncio.run(run())
+    if args.filter_worker:
+        logger.opt(colors=True).info("<M>Starting filter worker...</M>")
+        asyncio.run(run_filter_worker())
+    else:
+        logger.opt(colors=True).info("<M>Starting unified app...</M>")
+        asyncio.run(run())
     logger.debug("Application finished")
     return
 
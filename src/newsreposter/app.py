@@ -7,38 +7,178 @@ logging.setup_logger(level="DEBUG" if args.debug else "INFO")
 
 async def run():
     from functools import partial
+    from pathlib import Path
 
     from loguru import logger
 
-    from newsreposter.core.config import settings
-    from newsreposter.core.post import aiogram_post_item
+    from newsreposter.core import metrics, parsers
+    from newsreposter.core.parsers import post_parsers
+    from newsreposter.core.config import ChannelConfig, settings
+    from newsreposter.core.post import (
+        aiogram_post_digest,
+        aiogram_post_item,
+        prefetch_post_data,
+        prepare_post_item,
+    )
+    from newsreposter.core.rate_limiter import TelegramRateLimiter
     from newsreposter.services.bot import BotService, BotServiceConfig
-    from newsreposter.services.news_checker import NewsChecker
-    from newsreposter.services.news_queue import FileQueue, QueuePoster
+    from newsreposter.services.news_checker import (
+        ChannelTarget,
+        InProcessFilter,
+        NewsChecker,
+    )
+    from newsreposter.services.news_queue import QUEUE_DIR, FileQueue, QueuePoster
+    from newsreposter.services.prefetcher import ArticlePrefetcher
+    from newsreposter.services.retry import RetryPolicy
 
     logger = logger.opt(colors=True)
 
     logger.debug("Starting application")
-    queue = FileQueue()
-    logger.debug("FileQueue created")
+    metrics.ENABLED = settings.METRICS
+    reporter = metrics.MetricsReporter(settings.METRICS_DUMP_SECONDS)
+    parsers.set_html_parser(settings.HTML_PARSER)
+    post_parsers.build_routes()
+    parsers.configure_parse_pool(
+        settings.PARSE_PROCESSES, log_level="DEBUG" if args.debug else "INFO"
+    )
+    journal = None
+    if settings.GROUP_COMMIT:
+        from newsreposter.services.journal import GroupCommitJournal
 
-    newschecker = NewsChecker(q=queue)
-    logger.debug("NewsChecker initialized")
+        journal = GroupCommitJournal(
+            settings.JOURNAL_FILE,
+            window_seconds=settings.GROUP_COMMIT_WINDOW_MS / 1000,
+        )
+        logger.debug("Group commit journal at {}", settings.JOURNAL_FILE)
+
+    channels = settings.CHANNELS or [
+        ChannelConfig(name="default", chat_id=settings.CHAT_ID)
+    ]
+
+    def open_queue(name: str):
+        # the first channel keeps the single-channel paths
+        if settings.QUEUE_BACKEND == "sqlite":
+            from newsreposter.services.sqlite_queue import (
+                SqliteQueue,
+                migrate_file_queue_dir,
+            )
+
+            db = Path(settings.QUEUE_DB)
+            if name != channels[0].name:
+                db = db.with_name(f"{db.stem}_{name}{db.suffix}")
+                return SqliteQueue(db)
+            queue = SqliteQueue(db)
+            migrate_file_queue_dir(queue)
+            return queue
+        if name != channels[0].name:
+            return FileQueue(QUEUE_DIR.with_name(f"news_queue_{name}"), journal=journal)
+        return FileQueue(journal=journal)
+
+    if settings.FILTER_WORKER:
+        from newsreposter.services.filter_worker import FilterWorkerClient
+
+        filter_client = FilterWorkerClient(settings.FILTER_WORKER_SOCKET)
+        logger.debug("Using filter worker at {}", settings.FILTER_WORKER_SOCKET)
+    else:
+        filter_client = InProcessFilter(
+            [c.model_dump() for c in channels] if settings.CHANNELS else None
+        )
 
     botservice = BotService(service_config=BotServiceConfig(token=settings.TOKEN))
     logger.debug("BotService created")
     await botservice.initialize()
     logger.debug("BotService initialized")
 
-    poster = QueuePoster(
-        queue, partial(aiogram_post_item, bot=botservice.bot, chat_id=settings.CHAT_ID)
+    # one limiter for all channels: the global limit is per bot
+    limiter = TelegramRateLimiter(
+        global_per_second=settings.GLOBAL_MESSAGES_PER_SECOND,
+        chat_per_minute=settings.CHAT_MESSAGES_PER_MINUTE,
     )
-    logger.debug("QueuePoster created")
+    targets = []
+    posters = []
+    for channel in channels:
+        queue = open_queue(channel.name)
+        prefetcher = ArticlePrefetcher(
+            queue, prefetch_post_data, max_concurrency=settings.PREFETCH_CONCURRENCY
+        )
+        targets.append(ChannelTarget(channel.name, queue, prefetcher))
+        posters.append(
+            QueuePoster(
+                queue,
+                partial(
+                    aiogram_post_item,
+                    bot=botservice.bot,
+                    chat_id=channel.chat_id,
+                    limiter=limiter,
+                ),
+                interval_seconds=settings.POSTER_INTERVAL_SECONDS,
+                max_per_run=settings.POSTS_PER_RUN or None,
+                prepare_cb=partial(
+                    prepare_post_item, check_media=settings.MEDIA_CHECK
+                ),
+                max_in_flight=settings.POSTER_IN_FLIGHT,
+                retry_policy=RetryPolicy(
+                    base_seconds=settings.RETRY_BASE_SECONDS,
+                    max_seconds=settings.RETRY_MAX_SECONDS,
+                ),
+                digest_cb=partial(
+                    aiogram_post_digest,
+                    bot=botservice.bot,
+                    chat_id=channel.chat_id,
+                    limiter=limiter,
+                )
+                if settings.DIGEST_THRESHOLD
+                else None,
+                digest_threshold=settings.DIGEST_THRESHOLD,
+                digest_max_items=settings.DIGEST_MAX_ITEMS,
+            )
+        )
+        logger.debug("Queue, prefetcher and poster created for {}", channel.name)
 
+    newschecker = NewsChecker(
+        news_filter=filter_client.process_news,
+        journal=journal,
+        item_ttl_ms=int(settings.ITEM_TTL_HOURS * 60 * 60 * 1000),
+        source_priority=settings.SOURCE_PRIORITY,
+        targets=targets,
+        batch_filter=filter_client.filter_batch if settings.CHANNELS else None,
+        forget=filter_client.forget,
+    )
+    logger.debug("NewsChecker initialized")
+
+    for target in targets:
+        await target.prefetcher.start()
+    logger.info("<C>ArticlePrefetcher started.</C>")
     await newschecker.start()
     logger.info("<C>NewsChecker started.</C>")
-    await poster.start()
-    logger.info("<C>QueuePoster started.</C>")
+    for poster in posters:
+        await poster.start()
+    logger.info("<C>QueuePoster started for {} channel(s).</C>", len(posters))
+
+    if settings.METRICS:
+        await reporter.start()
+        logger.info("<C>MetricsReporter started.</C>")
+    metrics_server = None
+    if settings.METRICS_PORT:
+        from newsreposter.core.post import get_file_id_cache
+        from newsreposter.services.metrics_server import MetricsServer
+
+        metrics_server = MetricsServer(
+            {target.name: target.queue for target in targets},
+            caches={
+                "seen_links": newschecker.seen_links,
+                "file_ids": get_file_id_cache(),
+            },
+            host=settings.METRICS_HOST,
+            port=settings.METRICS_PORT,
+            dedup_sizes=filter_client.cache_sizes,
+        )
+        await metrics_server.start()
+        logger.info(
+            "<C>Metrics served on {}:{}.</C>",
+            settings.METRICS_HOST,
+            settings.METRICS_PORT,
+        )
 
     logger.info("<G>Started unified app!</G>")
     try:
@@ -47,8 +187,43 @@ async def run():
         pass
     logger.info("<R>Shutting down...</R>")
 
+    await reporter.stop()
+    if metrics_server:
+        await metrics_server.stop()
     await botservice.bot.session.close()
-    await poster.stop()
+    for poster in posters:
+        await poster.stop()
     await newschecker.close()
+    if journal:
+        await journal.close()
+    for target in targets:
+        await target.prefetcher.stop()
+    if settings.FILTER_WORKER:
+        await filter_client.close()
+    parsers.shutdown_parse_pool()
+    if settings.QUEUE_BACKEND == "sqlite":
+        for target in targets:
+            target.queue.close()
 
     logger.warning("<Y><black>Script stopped.</black></Y>")
+
+
+async def run_filter_worker():
+    from loguru import logger
+
+    from newsreposter.core.config import settings
+    from newsreposter.services.filter_worker import FilterWorker
+
+    logger = logger.opt(colors=True)
+
+    worker = FilterWorker(
+        settings.FILTER_WORKER_SOCKET,
+        cpus=settings.FILTER_WORKER_CPUS,
+        channels=[c.model_dump() for c in settings.CHANNELS],
+    )
+    logger.info("<G>Starting filter worker...</G>")
+    try:
+        await worker.serve_forever()
+    except asyncio.exceptions.CancelledError:
+        pass
+    logger.warning("<Y><black>Filter worker stopped.</black></Y>")
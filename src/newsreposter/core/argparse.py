@@ -5,6 +5,7 @@ from loguru import logger
 
 class ArgsNamespace(argparse.Namespace):
     debug: bool = False
+    filter_worker: bool = False
 
 
 parser = argparse.ArgumentParser()
@@ -17,6 +18,13 @@ parser.add_argument(
     action=argparse.BooleanOptionalAction,
 )
 
+parser.add_argument(
+    "--filter-worker",
+    help="Run the standalone news filter worker instead of the bot.",
+    default=False,
+    action=argparse.BooleanOptionalAction,
+)
+
 args = parser.parse_args(namespace=ArgsNamespace())
 
 if args.debug:
@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from loguru import logger
+
+
+class PersistentLRUCache:
+    def __init__(
+        self,
+        path: Optional[str],
+        max_size: int,
+        ttl_seconds: Optional[float] = None,
+        autosave: bool = True,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.autosave = autosave
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # snapshot, write and replace of one save finish before the next starts,
+        # so an older snapshot never replaces a newer file
+        self._save_lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._dirty = False
+        self.load()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        logger.debug("Loading cache from {}", self.path)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception:
+            logger.exception("Failed to load cache {}, starting empty", self.path)
+            return
+        now = time.time()
+        with self._lock:
+            self._entries.clear()
+            for key, stored_at, value in rows:
+                if not self._expired(stored_at, now):
+                    self._entries[key] = (stored_at, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logger.debug("Loaded {} cache entries from {}", len(self._entries), self.path)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [[key, stored_at, value] for key, (stored_at, value) in self._entries.items()]
+            self._dirty = False
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.path)),
+                prefix=os.path.basename(self.path) + ".",
+                suffix=".tmp",
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception:
+            logger.exception("Failed to save cache {}", self.path)
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            with self._lock:
+                self._dirty = True
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0], now):
+                if entry is not None:
+                    del self._entries[key]
+                    self._dirty = True
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        if self.autosave:
+            self.save()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._dirty = True
+        if self.autosave:
+            self.save()
+        return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[0], time.time())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
@@ -1,10 +1,21 @@
 from pathlib import Path
+from typing import Literal
+
 from loguru import logger
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 logger.debug("Initializing config module")
 
 
+class ChannelConfig(BaseModel):
+    name: str
+    chat_id: int
+    words_file: str = "words.json"
+    relevance_threshold: float = 0.80
+    similarity_threshold: float = 0.80
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=Path(__file__).parent.parent.parent.parent / ".env",
@@ -14,6 +25,53 @@ class Settings(BaseSettings):
 
     TOKEN: str
     CHAT_ID: int
+    # several output channels fed from one fetch pass; empty posts everything
+    # to CHAT_ID with the default vocabulary
+    CHANNELS: list[ChannelConfig] = []
+
+    FILTER_WORKER: bool = False
+    FILTER_WORKER_SOCKET: str = "filter_worker.sock"
+    FILTER_WORKER_CPUS: list[int] = []
+
+    PARSE_PROCESSES: int = 0
+    HTML_PARSER: Literal["html.parser", "lxml"] = "html.parser"
+
+    QUEUE_BACKEND: Literal["file", "sqlite"] = "file"
+    QUEUE_DB: str = "news_queue.db"
+    GROUP_COMMIT: bool = True
+    JOURNAL_FILE: str = "journal.log"
+    GROUP_COMMIT_WINDOW_MS: int = 5
+
+    # items still unposted this long after they were fetched are archived
+    # instead of posted; 0 keeps them until posted
+    ITEM_TTL_HOURS: float = 0
+    # added to an item's priority by source (pre-parser module name)
+    SOURCE_PRIORITY: dict[str, float] = {}
+
+    PREFETCH_CONCURRENCY: int = 2
+    # HEAD-check media urls before posting, dropping broken or oversized ones
+    MEDIA_CHECK: bool = True
+
+    # 0 drains the queue as fast as the Telegram limits allow
+    POSTS_PER_RUN: int = 0
+    POSTER_INTERVAL_SECONDS: int = 5
+    POSTER_IN_FLIGHT: int = 4
+    GLOBAL_MESSAGES_PER_SECOND: float = 30
+    CHAT_MESSAGES_PER_MINUTE: float = 20
+    # with more than DIGEST_THRESHOLD items queued, post titles and links in
+    # digests of up to DIGEST_MAX_ITEMS; 0 disables digests
+    DIGEST_THRESHOLD: int = 0
+    DIGEST_MAX_ITEMS: int = 10
+    RETRY_BASE_SECONDS: float = 30
+    RETRY_MAX_SECONDS: float = 60 * 60
+
+    # per-stage latency histograms, logged every METRICS_DUMP_SECONDS
+    METRICS: bool = True
+    METRICS_DUMP_SECONDS: int = 5 * 60
+    # serves Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics;
+    # 0 disables the endpoint
+    METRICS_PORT: int = 0
+    METRICS_HOST: str = "127.0.0.1"
 
 
 logger.debug("Loading settings from environment")
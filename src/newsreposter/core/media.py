@@ -0,0 +1,85 @@
+import asyncio
+from typing import Container, List, Optional
+
+import aiohttp
+from loguru import logger
+
+from newsreposter.core.cache import PersistentLRUCache
+
+PHOTO = "photo"
+VIDEO = "video"
+# Bot API limits for media sent by URL
+MAX_BYTES = {PHOTO: 5 * 1024 * 1024, VIDEO: 20 * 1024 * 1024}
+CHECK_TIMEOUT_SECONDS = 3
+CHECK_CACHE_SIZE = 2000
+CHECK_CACHE_TTL_SECONDS = 60 * 60
+# servers that do not implement HEAD; the media itself may be fine
+UNSUPPORTED_HEAD = {405, 501}
+# throttled or a passing server error: ask again next time
+TEMPORARY = {429}
+
+_check_cache = PersistentLRUCache(
+    None, max_size=CHECK_CACHE_SIZE, ttl_seconds=CHECK_CACHE_TTL_SECONDS
+)
+
+
+def check_response(
+    kind: str, status: int, content_type: str, length: Optional[int]
+) -> Optional[bool]:
+    # None means the response says nothing either way, and is not cached
+    if status in UNSUPPORTED_HEAD or status in TEMPORARY or status >= 500:
+        return None
+    if status >= 400:
+        return False
+    if content_type.startswith("text/"):
+        return False
+    if length is not None and length > MAX_BYTES[kind]:
+        return False
+    return True
+
+
+async def check_media_url(
+    session: aiohttp.ClientSession, url: str, kind: str
+) -> Optional[bool]:
+    cached = _check_cache.get((kind, url))
+    if cached is not None:
+        return cached
+    try:
+        async with session.head(url, allow_redirects=True) as resp:
+            ok = check_response(
+                kind, resp.status, resp.content_type or "", resp.content_length
+            )
+            logger.debug(
+                "HEAD {}: {} {} {} -> {}",
+                url,
+                resp.status,
+                resp.content_type,
+                resp.content_length,
+                ok,
+            )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # slow or flaky origin: let Telegram decide, and ask again next time
+        logger.debug("HEAD {} failed: {!r}", url, e)
+        return None
+    if ok is not None:
+        _check_cache.put((kind, url), ok)
+    return ok
+
+
+async def validate_media(
+    urls: List[str], kind: str, trusted: Container[str] = ()
+) -> List[str]:
+    # drops media Telegram would reject, keeping the order; urls in trusted
+    # (already uploaded) are not checked
+    to_check = [url for url in urls if url not in trusted]
+    if not to_check:
+        return list(urls)
+    timeout = aiohttp.ClientTimeout(total=CHECK_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        results = await asyncio.gather(
+            *(check_media_url(session, url, kind) for url in to_check)
+        )
+    rejected = {url for url, ok in zip(to_check, results) if ok is False}
+    if rejected:
+        logger.warning("Dropping {} {} url(s): {}", len(rejected), kind, rejected)
+    return [url for url in urls if url not in rejected]
@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# log-linear buckets as in HdrHistogram: SUB_BUCKETS per power of two keeps
+# every recorded value within ~6% of its bucket's upper bound
+SUB_BUCKETS = 16
+MIN_VALUE_MS = 0.001
+# upper bounds counted exactly, not by bucket: the Prometheus "le" buckets
+EXACT_BOUNDS_MS = (
+    1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 30000, 60000, 300000, 1800000, 3600000
+)
+PERCENTILES = (50, 95, 99)
+DUMP_INTERVAL_SECONDS = 5 * 60
+# publication -> post delay is reported over this trailing window
+FRESHNESS_WINDOW_SECONDS = 60 * 60
+FRESHNESS_MAX_SAMPLES = 10000
+
+ENABLED = True
+
+
+def bucket_index(value_ms: float) -> int:
+    mantissa, exponent = math.frexp(max(value_ms, MIN_VALUE_MS))
+    # mantissa is in [0.5, 1)
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_upper(index: int) -> float:
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        # values per EXACT_BOUNDS_MS slot, the last one is above every bound
+        self.bound_counts = [0] * (len(EXACT_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms: float):
+        index = bucket_index(value_ms)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.bound_counts[bisect.bisect_left(EXACT_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def merge(self, other: "Histogram"):
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        for slot, n in enumerate(other.bound_counts):
+            self.bound_counts[slot] += n
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_upper(index), self.max_ms)
+        return self.max_ms
+
+    def count_le(self, value_ms: float) -> int:
+        # recorded values <= value_ms: exact for EXACT_BOUNDS_MS, otherwise the
+        # buckets that end at or below it (up to ~6% of value_ms too low)
+        slot = bisect.bisect_left(EXACT_BOUNDS_MS, value_ms)
+        if slot < len(EXACT_BOUNDS_MS) and EXACT_BOUNDS_MS[slot] == value_ms:
+            return sum(self.bound_counts[: slot + 1])
+        return sum(
+            n for index, n in self.counts.items() if bucket_upper(index) <= value_ms
+        )
+
+    def summary(self) -> Dict[str, float]:
+        out = {f"p{p}": round(self.percentile(p), 3) for p in PERCENTILES}
+        out["count"] = self.count
+        out["mean"] = round(self.total_ms / self.count, 3) if self.count else 0.0
+        out["max"] = round(self.max_ms, 3)
+        return out
+
+
+_lock = threading.Lock()
+# (stage, site) -> histogram of durations in milliseconds
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+# source -> (recorded at, delay in ms), oldest first
+_freshness: Dict[str, Deque[Tuple[float, float]]] = {}
+# (name, sorted label pairs) -> running total
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_post_times: Deque[float] = deque(maxlen=FRESHNESS_MAX_SAMPLES)
+
+
+def record(stage: str, duration_ms: float, site: str = ""):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get((stage, site))
+        if hist is None:
+            hist = _histograms[(stage, site)] = Histogram()
+        hist.record(duration_ms)
+
+
+@contextmanager
+def span(stage: str, site: str = "") -> Iterator[None]:
+    # also records when the body raises: failures take time too
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, (time.perf_counter() - start) * 1000, site)
+
+
+def histogram(stage: str, site: Optional[str] = None) -> Histogram:
+    # a copy; site=None merges every site of the stage
+    merged = Histogram()
+    with _lock:
+        for (s, st), hist in _histograms.items():
+            if s == stage and (site is None or st == site):
+                merged.merge(hist)
+    return merged
+
+
+def percentiles(stage: str, site: Optional[str] = None) -> Dict[str, float]:
+    return histogram(stage, site).summary()
+
+
+def snapshot() -> Dict[Tuple[str, str], Dict[str, float]]:
+    with _lock:
+        keys = sorted(_histograms)
+    return {key: percentiles(*key) for key in keys}
+
+
+def stages() -> List[str]:
+    with _lock:
+        return sorted({stage for stage, _ in _histograms})
+
+
+def increment(name: str, value: float = 1, **labels: str):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def counters() -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    with _lock:
+        return dict(_counters)
+
+
+def record_post(now: Optional[float] = None):
+    if not ENABLED:
+        return
+    with _lock:
+        _post_times.append(time.time() if now is None else now)
+
+
+def posts_per_minute(now: Optional[float] = None) -> int:
+    cutoff = (time.time() if now is None else now) - 60
+    with _lock:
+        while _post_times and _post_times[0] < cutoff:
+            _post_times.popleft()
+        return len(_post_times)
+
+
+def histograms() -> Dict[Tuple[str, str], Histogram]:
+    # copies, safe to read while spans keep recording
+    with _lock:
+        keys = list(_histograms)
+    return {key: histogram(*key) for key in keys}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _freshness.clear()
+        _counters.clear()
+        _post_times.clear()
+
+
+def record_freshness(source: str, delay_ms: float, now: Optional[float] = None):
+    # how long after publication an item reached the channel
+    if not ENABLED:
+        return
+    record("freshness", delay_ms, source)
+    now = time.time() if now is None else now
+    with _lock:
+        samples = _freshness.get(source)
+        if samples is None:
+            samples = _freshness[source] = deque(maxlen=FRESHNESS_MAX_SAMPLES)
+        samples.append((now, delay_ms))
+
+
+def freshness(
+    now: Optional[float] = None, window_seconds: float = FRESHNESS_WINDOW_SECONDS
+) -> Dict[str, Dict[str, float]]:
+    # per source over the trailing window, "" for all sources together
+    cutoff = (time.time() if now is None else now) - window_seconds
+    total = Histogram()
+    out = {}
+    with _lock:
+        for source, samples in sorted(_freshness.items()):
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            if not samples:
+                continue
+            hist = Histogram()
+            for _, delay_ms in samples:
+                hist.record(delay_ms)
+            total.merge(hist)
+            out[source] = hist.summary()
+    if total.count:
+        out[""] = total.summary()
+    return out
+
+
+def freshness_report(now: Optional[float] = None) -> str:
+    lines = []
+    for source, s in freshness(now).items():
+        lines.append(
+            f"{source or 'all':<14} n={s['count']:<6} p50={s['p50'] / 1000:.0f}s"
+            f" p95={s['p95'] / 1000:.0f}s max={s['max'] / 1000:.0f}s"
+        )
+    return "\n".join(lines)
+
+
+def report() -> str:
+    lines = []
+    for stage in stages():
+        s = percentiles(stage)
+        lines.append(
+            f"{stage:<14} n={s['count']:<6} p50={s['p50']:.1f}ms"
+            f" p95={s['p95']:.1f}ms p99={s['p99']:.1f}ms max={s['max']:.1f}ms"
+        )
+    return "\n".join(lines)
+
+
+class MetricsReporter:
+    def __init__(self, interval_seconds: float = DUMP_INTERVAL_SECONDS):
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            text = report()
+            if text:
+                logger.info("Stage latencies:\n{}", text)
+            text = freshness_report()
+            if text:
+                logger.info("Publication to post delay, last hour:\n{}", text)
@@ -1,43 +1,220 @@
 import datetime
 import email.utils
 import html
+import multiprocessing
 import re
+import sys
 import xml.etree.ElementTree as ET
 import zoneinfo
-from typing import List, Literal, Optional
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+)
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
 
 import requests
 import urllib3
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.filter import ElementFilter
 from loguru import logger
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import BrowserContext, Page, Route, sync_playwright
+
+from newsreposter.core import metrics
 
 MOSCOW_TZ = zoneinfo.ZoneInfo("Europe/Moscow")
 
+T = TypeVar("T")
+
+HTML_PARSER: Literal["html.parser", "lxml"] = "html.parser"
+RSS_CHUNK_SIZE = 64 * 1024
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+# parse_only filter keeping every subtree matched by any of the strainers
+class Regions(ElementFilter):
+    def __init__(self, *strainers: SoupStrainer):
+        super().__init__()
+        self.strainers = strainers
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return any(s.allow_tag_creation(nsprefix, name, attrs) for s in self.strainers)
+
+    def allow_string_creation(self, string: str) -> bool:
+        return False
+
+
+def region(name: str, css_class: str | re.Pattern | None = None, **attrs) -> SoupStrainer:
+    if isinstance(css_class, str):
+        # raw class attribute is not split yet while parsing
+        css_class = re.compile(rf"(?:^|\s){re.escape(css_class)}(?:\s|$)")
+    if css_class is not None:
+        attrs["class"] = css_class
+    return SoupStrainer(name, attrs=attrs)
+
+
+def make_soup(
+    markup: str | bytes, parse_only: Optional[ElementFilter] = None
+) -> BeautifulSoup:
+    return BeautifulSoup(markup, HTML_PARSER, parse_only=parse_only)
+
+
+def set_html_parser(name: Literal["html.parser", "lxml"]):
+    global HTML_PARSER
+    if name == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            logger.warning("lxml is not installed, falling back to html.parser")
+            name = "html.parser"
+    HTML_PARSER = name
+    logger.debug("Using {} HTML parser", HTML_PARSER)
+
+
+def _init_parse_worker(log_level: str, html_parser: Literal["html.parser", "lxml"]):
+    logger.remove()
+    logger.add(sys.stdout, level=log_level)
+    set_html_parser(html_parser)
+
+
+def configure_parse_pool(processes: int, log_level: str = "INFO"):
+    global _parse_pool
+    shutdown_parse_pool()
+    if processes <= 0:
+        logger.debug("HTML parsing runs in the calling thread")
+        return
+    _parse_pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_parse_worker,
+        initargs=(log_level.upper(), HTML_PARSER),
+    )
+    logger.debug("Started HTML parse pool with {} processes", processes)
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+def run_parser(func: Callable[..., T], *args: Any, stage: str, site: str = "") -> T:
+    # func and args must be picklable: module-level functions and plain data;
+    # site is site_label() of the page, as for its fetch span
+    with metrics.span(stage, site):
+        if _parse_pool is None:
+            return func(*args)
+        return _parse_pool.submit(func, *args).result()
+
+
+SIMPLE_TAGS = frozenset(
+    {
+        "a", "abbr", "b", "big", "blockquote", "br", "cite", "code", "dd", "del",
+        "div", "dl", "dt", "em", "figcaption", "figure", "font", "h1", "h2", "h3",
+        "h4", "h5", "h6", "hr", "i", "img", "ins", "li", "mark", "ol", "p", "pre",
+        "q", "s", "small", "span", "strike", "strong", "sub", "sup", "table",
+        "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+    }
+)
+SIMPLE_TAG_RE = re.compile(
+    r"</?([a-zA-Z][a-zA-Z0-9]*)"
+    r"""(?:\s+[^\s"'<>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>=`]+))?)*"""
+    r"\s*/?>"
+)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _strip_simple_tags(text: str) -> Optional[str]:
+    # None means the markup is not simple enough and needs a real parser
+    if "&" in text:
+        return None
+    simple = True
+
+    def replace(match: re.Match) -> str:
+        nonlocal simple
+        if match.group(1).lower() not in SIMPLE_TAGS:
+            simple = False
+        return " "
+
+    stripped = SIMPLE_TAG_RE.sub(replace, text)
+    if not simple or "<" in stripped:
+        return None
+    return stripped
+
+
+def _clean_html_soup(text: str) -> str:
+    soup = BeautifulSoup(text, "html.parser")
+    for tag in soup(["script", "style", "iframe", "noscript"]):
+        tag.decompose()
+    return soup.get_text(separator=" ")
+
 
 def clean_html(text: str) -> str:
+    with metrics.span("clean_html"):
+        return _clean_html(text)
+
+
+def _clean_html(text: str) -> str:
     if not text:
         logger.debug("Empty text provided to clean_html")
         return ""
     logger.debug("Cleaning HTML text: {} chars", len(text))
     text = html.unescape(text)
 
-    soup = BeautifulSoup(text, "html.parser")
-    for tag in soup(["script", "style", "iframe", "noscript"]):
-        tag.decompose()
-    clean_text = soup.get_text(separator=" ")
-    clean_text = re.sub(r"\s+", " ", clean_text).strip()
+    if "<" not in text and "&" not in text:
+        clean_text = text
+    else:
+        clean_text = _strip_simple_tags(text)
+        if clean_text is None:
+            clean_text = _clean_html_soup(text)
+    clean_text = WHITESPACE_RE.sub(" ", clean_text).strip()
     logger.debug("Cleaned text: {} chars", len(clean_text))
 
     return clean_text
 
 
-def parse_rss_items(xml_bytes: str | bytes) -> List[ET.Element]:
-    logger.debug("Parsing RSS items from {} bytes", len(xml_bytes))
-    root = ET.fromstring(xml_bytes)
-    items = root.findall(".//item")
-    logger.debug("Found {} RSS items", len(items))
-    return items
+def iter_rss_items(
+    xml_bytes: str | bytes, chunk_size: int = RSS_CHUNK_SIZE
+) -> Iterator[ET.Element]:
+    # yields each <item> as soon as it is closed and frees it once the
+    # consumer moves on, so callers may stop early without parsing the rest
+    logger.debug("Streaming RSS items from {} bytes", len(xml_bytes))
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parents: List[ET.Element] = []
+    found = 0
+
+    def items() -> Iterator[ET.Element]:
+        for event, elem in parser.read_events():
+            if event == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            if elem.tag == "item":
+                yield elem
+
+    for start in range(0, len(xml_bytes), chunk_size):
+        parser.feed(xml_bytes[start : start + chunk_size])
+        for item in items():
+            found += 1
+            yield item
+            if parents:
+                parents[-1].remove(item)
+            item.clear()
+    parser.close()
+    for item in items():
+        found += 1
+        yield item
+    logger.debug("Found {} RSS items", found)
 
 
 def parsed_pubdate(pubdate_str: str) -> Optional[datetime.datetime]:
@@ -69,10 +246,187 @@ def find_by_localname(item: ET.Element, localname: str) -> str:
     return ""
 
 
-def get_rendered_page(url: str, return_type: Literal["text_content", "content"]="content"):
+# dropped from dedup keys only: on some sites from/ref/rss select content, so
+# published links lose nothing but the utm_* family
+TRACKING_PARAMS = frozenset(
+    {"fbclid", "gclid", "yclid", "ysclid", "_openstat", "from", "ref", "rss", "utm"}
+)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def ascii_host(host: str) -> str:
+    host = host.strip().lower().rstrip(".")
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def site_label(url: str) -> str:
+    # the site a metric belongs to: fetch and parse spans of a page share it
+    host = ascii_host(urlsplit(url).hostname or "")
+    return host[4:] if host.startswith("www.") else host
+
+
+def canonicalize_url(url: str, base: Optional[str] = None) -> str:
+    # safe to publish: keeps scheme, www. and path, drops utm_* and fragment
+    url = (url or "").strip()
+    if not url:
+        return ""
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = _drop_params(parts.query, lambda k: k.startswith("utm_"))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def _drop_params(query: str, drop: Callable[[str], bool]) -> str:
+    # drop gets the lowercased name; an untouched query keeps its encoding
+    params = parse_qsl(query, keep_blank_values=True)
+    kept = [(k, v) for k, v in params if not drop(k.lower())]
+    return query if len(kept) == len(params) else urlencode(kept)
+
+
+def _is_tracking(name: str) -> bool:
+    return name in TRACKING_PARAMS or name.startswith("utm_")
+
+
+def url_key(url: str) -> str:
+    # dedup key: the same article under http/https, www. or a trailing slash
+    canonical = canonicalize_url(url)
+    if not canonical:
+        return ""
+    parts = urlsplit(canonical)
+    host = ascii_host(parts.netloc)
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/") or "/"
+    query = _drop_params(parts.query, _is_tracking)
+    return host + path + (f"?{query}" if query else "")
+
+
+WaitStrategy = Callable[[Page], None]
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+TRACKER_HOSTS = (
+    "mc.yandex.ru",
+    "an.yandex.ru",
+    "yandex.ru/ads",
+    "top-fwz1.mail.ru",
+    "top.mail.ru",
+    "counter.yadro.ru",
+    "tns-counter.ru",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "adfox.ru",
+    "adriver.ru",
+    "mediametrics.ru",
+    "smi2.ru",
+    "24smi.",
+    "relap.io",
+    "vk.com/rtrg",
+    "scorecardresearch.com",
+)
+
+
+def wait_for_selector(selector: str, timeout: int = 1000) -> WaitStrategy:
+    def wait(page: Page):
+        try:
+            page.wait_for_selector(selector, timeout=timeout)
+        except Exception:
+            pass
+
+    return wait
+
+
+def wait_for_load_state(
+    state: Literal["load", "domcontentloaded", "networkidle"] = "domcontentloaded",
+    timeout: int = 5000,
+) -> WaitStrategy:
+    def wait(page: Page):
+        try:
+            page.wait_for_load_state(state, timeout=timeout)
+        except Exception:
+            pass
+
+    return wait
+
+
+def no_wait(page: Page):
+    pass
+
+
+@dataclass(frozen=True)
+class RenderPolicy:
+    blocked_resource_types: FrozenSet[str] = DEFAULT_BLOCKED_RESOURCE_TYPES
+    block_trackers: bool = True
+    wait: WaitStrategy = wait_for_selector("article")
+
+
+DEFAULT_RENDER_POLICY = RenderPolicy()
+# keyed by host (or parent domain); scripts stay allowed unless a site is static
+RENDER_POLICIES: Dict[str, RenderPolicy] = {
+    "fsb.ru": RenderPolicy(
+        blocked_resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES | {"script"},
+        wait=no_wait,
+    ),
+}
+
+
+def render_policy_for(url: str) -> RenderPolicy:
+    host = (urlsplit(url).hostname or "").lower()
+    while host:
+        if host in RENDER_POLICIES:
+            return RENDER_POLICIES[host]
+        _, _, host = host.partition(".")
+    return DEFAULT_RENDER_POLICY
+
+
+def _install_policy(context: BrowserContext, policy: RenderPolicy) -> List[int]:
+    blocked = [0]
+
+    def handle(route: Route):
+        request = route.request
+        if request.resource_type in policy.blocked_resource_types or (
+            policy.block_trackers
+            and any(tracker in request.url for tracker in TRACKER_HOSTS)
+        ):
+            blocked[0] += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    if policy.blocked_resource_types or policy.block_trackers:
+        context.route("**/*", handle)
+    return blocked
+
+
+def get_rendered_page(
+    url: str,
+    return_type: Literal["text_content", "content"] = "content",
+    policy: Optional[RenderPolicy] = None,
+):
+    with metrics.span("fetch", site_label(url)):
+        return _get_rendered_page(url, return_type, policy)
+
+
+def _get_rendered_page(
+    url: str,
+    return_type: Literal["text_content", "content"],
+    policy: Optional[RenderPolicy],
+):
+    policy = policy or render_policy_for(url)
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
+        context = browser.new_context()
+        blocked = _install_policy(context, policy)
+        page = context.new_page()
 
         try:
             resp = page.goto(url, timeout=50000)
@@ -98,17 +452,14 @@ def get_rendered_page(url: str, return_type: Literal["text_content", "content"]=
                         logger.error(f"Failed. Giving up with {url}. {e}")
                     return None
 
-        try:
-            page.wait_for_selector("article", timeout=1000)
-        except Exception:
-            pass
-
         if return_type == "text_content":
             if not resp:
                 raise Exception("response is None")
             content = resp.text()
         else:
+            policy.wait(page)
             content = getattr(page, return_type)()
 
+        logger.debug("Rendered {} ({} requests blocked)", url, blocked[0])
         browser.close()
         return content
@@ -1,40 +1,124 @@
 import importlib
-import re
+import os
 from functools import partial
-from typing import Dict, List, Optional
+from types import ModuleType
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
 
 from bs4 import BeautifulSoup, Tag
+from bs4.filter import ElementFilter
 from loguru import logger
 
-from .. import get_rendered_page
+from newsreposter.core.cache import PersistentLRUCache
+
+from .. import (
+    ascii_host,
+    get_rendered_page,
+    make_soup,
+    run_parser,
+    site_label,
+    url_key,
+)
 
-CUSTOM_PARSERS = {"мвд": "mia"}
 ALLOWED_TAGS = {"b", "strong", "i", "em", "code", "a", "u", "s", "strike", "del", "pre"}
+ARTICLE_CACHE_FILE = "article_cache.json"
+ARTICLE_CACHE_SIZE = 500
+ARTICLE_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+_article_cache: Optional[PersistentLRUCache] = None
+_routes: Optional[Dict[str, ModuleType]] = None
+
+
+def get_article_cache() -> PersistentLRUCache:
+    global _article_cache
+    if _article_cache is None:
+        _article_cache = PersistentLRUCache(
+            ARTICLE_CACHE_FILE,
+            max_size=ARTICLE_CACHE_SIZE,
+            ttl_seconds=ARTICLE_CACHE_TTL_SECONDS,
+        )
+    return _article_cache
+
+
+def build_routes() -> Dict[str, ModuleType]:
+    global _routes
+    routes: Dict[str, ModuleType] = {}
+    pkg_path = os.path.dirname(__file__)
+    for fname in sorted(os.listdir(pkg_path)):
+        if not fname.endswith(".py") or fname.startswith("_"):
+            continue
+        module = importlib.import_module(f"{__name__}.{fname[:-3]}")
+        if not hasattr(module, "parse"):
+            continue
+        for host in getattr(module, "HOSTS", ()):
+            routes[ascii_host(host)] = module
+    logger.debug("Built post parser routes for {} hosts", len(routes))
+    _routes = routes
+    return routes
+
+
+def resolve(link: str) -> Optional[ModuleType]:
+    routes = _routes if _routes is not None else build_routes()
+    host = ascii_host(urlsplit(link.strip()).hostname or "")
+    while host:
+        if host in routes:
+            return routes[host]
+        _, _, host = host.partition(".")
+    return None
 
 
 def route(link: str) -> Optional[partial[Optional[Dict[str, List[str]]]]]:
-    match = re.search(r"https?://(?:www\.)?([^.]+)\.", link)
-    if not match:
+    parser_module = resolve(link)
+    if parser_module is None:
+        logger.debug("No post parser for {}, skipping render", link)
         return
-    parser = match.group(1)
-    parser_module = importlib.import_module(
-        f"newsreposter.core.parsers.post_parsers.{CUSTOM_PARSERS.get(parser, parser)}"
-    )
     html = get_rendered_page(link)
     if not html:
         return
-    return partial(parser_module.parse, BeautifulSoup(html, "html.parser"), link)
+    return partial(
+        run_parser,
+        parse_html,
+        parser_module.parse,
+        html,
+        link,
+        getattr(parser_module, "PARSE_ONLY", None),
+        stage="post_parse",
+        site=site_label(link),
+    )
+
+
+def parse_html(
+    parse_func: Callable[[BeautifulSoup, str], Optional[Dict[str, List[str]]]],
+    html: str | bytes,
+    link: str,
+    parse_only: Optional[ElementFilter] = None,
+) -> Dict[str, List[str]]:
+    return dict(parse_func(make_soup(html, parse_only), link) or {})
 
 
 def parse(url: str) -> Dict[str, List[str]]:
+    cache = get_article_cache()
+    key = url_key(url)
+    cached = cache.get(key)
+    logger.debug(
+        "Article cache {} for {} (hit rate {:.1%})",
+        "hit" if cached is not None else "miss",
+        key,
+        cache.hit_rate,
+    )
+    if cached is not None:
+        return cached
     try:
         _parse = route(url)
         if not _parse:
             return {}
-        return _parse() or {}
+        post_data = _parse() or {}
     except Exception as e:
         logger.error(f'Error parsing url "{url}": {e}')
         return {}
+    if post_data:
+        cache.put(key, post_data)
+    return post_data
 
 
 def get_text(input_tag: Tag):
@@ -4,8 +4,12 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("fedsfm.ru",)
+PARSE_ONLY = Regions(region("div", "ibox"))
+
 
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
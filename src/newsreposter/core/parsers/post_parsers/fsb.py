@@ -3,8 +3,13 @@ from typing import List
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("fsb.ru",)
+PARSE_ONLY = Regions(region("div", "_attr_text"))
+
+
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
 
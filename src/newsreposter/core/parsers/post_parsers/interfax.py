@@ -4,8 +4,16 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("interfax-russia.ru", "interfax.ru")
+PARSE_ONLY = Regions(
+    region("article", id="article"),
+    region("div", "article-page"),
+    region("section", "news-body"),
+)
+
 
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
@@ -5,8 +5,12 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("novayagazeta.ru",)
+PARSE_ONLY = Regions(region("article", id="article"), region("div", "article-page"))
+
 
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
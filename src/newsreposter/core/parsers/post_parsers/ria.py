@@ -4,8 +4,16 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("ria.ru",)
+PARSE_ONLY = Regions(
+    region("div", "article__body"),
+    region("article"),
+    region("div", "article__header"),
+)
+
 
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
@@ -4,8 +4,16 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("sledcom.ru",)
+PARSE_ONLY = Regions(
+    region("div", "news-card"),
+    region("div", "news-card__text"),
+    region("div", "news-card__img"),
+)
+
 
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
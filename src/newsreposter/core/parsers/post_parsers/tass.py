@@ -1,11 +1,20 @@
+import re
 from collections import defaultdict
 from typing import List
 from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
+from .. import Regions, region
 from . import get_text
 
+HOSTS = ("tass.ru",)
+PARSE_ONLY = Regions(
+    region("article"),
+    region("div", re.compile(r"^ContentPage_container")),
+)
+
+
 def parse(soup: BeautifulSoup, link: str) -> defaultdict[str, List[str]]:
     post = defaultdict(list)
 
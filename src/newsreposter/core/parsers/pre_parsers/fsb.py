@@ -1,12 +1,23 @@
 import datetime
 from typing import Dict, List, Union
 
-from bs4 import BeautifulSoup
 from loguru import logger
 
-from .. import MOSCOW_TZ, clean_html, get_rendered_page
+from .. import (
+    MOSCOW_TZ,
+    Regions,
+    canonicalize_url,
+    clean_html,
+    get_rendered_page,
+    make_soup,
+    region,
+    run_parser,
+    site_label,
+)
 
 FSB_URL = "http://www.fsb.ru/fsb/press/message.htm"
+FSB_BASE_URL = "http://www.fsb.ru/"
+PARSE_ONLY = Regions(region("div", "news"))
 
 
 def get_recent_items(
@@ -21,7 +32,12 @@ def get_recent_items(
         return out
     logger.debug("Successfully fetched FSB page")
 
-    soup = BeautifulSoup(content, "html.parser")
+    return run_parser(parse_items, content, stage="pre_parse", site=site_label(url))
+
+
+def parse_items(content: str | bytes) -> List[Dict[str, Union[str, int]]]:
+    out: List[Dict[str, Union[str, int]]] = []
+    soup = make_soup(content, PARSE_ONLY)
     news = soup.select_one("div.news")
     if news:
         news = news.find("ul", recursive=False)
@@ -49,11 +65,7 @@ def get_recent_items(
             continue
 
         title = a_tag.get_text(strip=True)
-        link = str(a_tag.get("href", ""))
-        if link.startswith("/"):
-            link = "http://www.fsb.ru" + link
-        elif link.startswith("fsb"):
-            link = "http://www.fsb.ru/" + link
+        link = canonicalize_url(str(a_tag.get("href", "")), base=FSB_BASE_URL)
 
         logger.debug("Adding FSB item: {}", title)
         out.append(
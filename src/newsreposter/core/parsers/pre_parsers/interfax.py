@@ -1,12 +1,23 @@
 import datetime
 from typing import Dict, List, Union
 
-from bs4 import BeautifulSoup
 from loguru import logger
 
-from .. import MOSCOW_TZ, clean_html, get_rendered_page
+from .. import (
+    MOSCOW_TZ,
+    Regions,
+    canonicalize_url,
+    clean_html,
+    get_rendered_page,
+    make_soup,
+    region,
+    run_parser,
+    site_label,
+)
 
 INTERFAX_URL = "https://www.interfax-russia.ru/news"
+INTERFAX_BASE_URL = "https://www.interfax-russia.ru/"
+PARSE_ONLY = Regions(region("ul", "lenta-all-news"))
 
 
 def get_recent_items(
@@ -21,7 +32,16 @@ def get_recent_items(
         return out
     logger.debug("Successfully fetched Interfax page")
 
-    soup = BeautifulSoup(content, "html.parser")
+    return run_parser(
+        parse_items, content, milliseconds, stage="pre_parse", site=site_label(url)
+    )
+
+
+def parse_items(
+    content: str | bytes, milliseconds: int = 0
+) -> List[Dict[str, Union[str, int]]]:
+    out: List[Dict[str, Union[str, int]]] = []
+    soup = make_soup(content, PARSE_ONLY)
 
     lista = soup.select_one("ul.lenta-all-news, ul.list-unstyled.lenta-all-news")
     if not lista:
@@ -115,11 +135,9 @@ def get_recent_items(
             continue
 
         title = a_tag.get_text(strip=True)
-        link = str(a_tag.get("href", ""))
-        if link.startswith("/"):
-            link = "https://www.interfax-russia.ru" + link
-        elif link and not link.startswith("http"):
-            link = "https://www.interfax-russia.ru/" + link.lstrip("/")
+        link = canonicalize_url(
+            str(a_tag.get("href", "")), base=INTERFAX_BASE_URL
+        )
 
         logger.debug("Adding Interfax item: {}", title)
         out.append(
@@ -5,10 +5,13 @@ from loguru import logger
 
 from .. import (
     MOSCOW_TZ,
+    canonicalize_url,
     clean_html,
     get_rendered_page,
-    parse_rss_items,
+    iter_rss_items,
     parsed_pubdate,
+    run_parser,
+    site_label,
 )
 
 NOVAYA_RSS = "https://novayagazeta.ru/feed/rss"
@@ -29,8 +32,16 @@ def get_recent_items(
         return out
     logger.debug("Successfuly fetched Novaya Gazeta page")
 
-    items = parse_rss_items(content)
-    for it in items:
+    return run_parser(
+        parse_items, content, cutoff, stage="pre_parse", site=site_label(url)
+    )
+
+
+def parse_items(
+    content: str | bytes, cutoff: datetime.datetime
+) -> List[Dict[str, Union[str, int]]]:
+    out = []
+    for it in iter_rss_items(content):
         pub = (
             it.findtext("pubDate")
             or it.findtext("{http://purl.org/dc/elements/1.1/}date")
@@ -50,7 +61,7 @@ def get_recent_items(
             {
                 "title": clean_html(title),
                 "description": clean_html(description),
-                "link": link,
+                "link": canonicalize_url(link),
                 "timestamp_ms": int(
                     dt.astimezone(datetime.timezone.utc).timestamp() * 1000
                 ),
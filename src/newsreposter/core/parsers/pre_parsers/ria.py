@@ -5,10 +5,13 @@ from loguru import logger
 
 from .. import (
     MOSCOW_TZ,
+    canonicalize_url,
     clean_html,
     get_rendered_page,
-    parse_rss_items,
+    iter_rss_items,
     parsed_pubdate,
+    run_parser,
+    site_label,
 )
 
 RIA_RSS = "https://ria.ru/export/rss2/archive/index.xml"
@@ -29,16 +32,27 @@ def get_recent_items(
         return out
     logger.debug("Successfully fetched RIA RSS")
 
-    items = parse_rss_items(content)
-    for item in items:
+    return run_parser(
+        parse_items, content, cutoff, stage="pre_parse", site=site_label(url)
+    )
+
+
+def parse_items(
+    content: str | bytes, cutoff: datetime.datetime
+) -> List[Dict[str, Union[str, int]]]:
+    out = []
+    for item in iter_rss_items(content):
         pub = (
             item.findtext("pubDate")
             or item.findtext("{http://purl.org/dc/elements/1.1/}date")
             or ""
         )
         dt = parsed_pubdate(pub)
-        if not dt or dt < cutoff:
+        if not dt:
             continue
+        if dt < cutoff:
+            # the archive feed is newest-first, everything below is older
+            break
 
         title = (item.findtext("title") or "").strip()
         link = (item.findtext("link") or "").strip()
@@ -47,7 +61,7 @@ def get_recent_items(
         out.append(
             {
                 "title": clean_html(title),
-                "link": link,
+                "link": canonicalize_url(link),
                 "timestamp_ms": int(
                     dt.astimezone(datetime.timezone.utc).timestamp() * 1000
                 ),
@@ -5,11 +5,14 @@ from loguru import logger
 
 from .. import (
     MOSCOW_TZ,
+    canonicalize_url,
     clean_html,
     find_by_localname,
     get_rendered_page,
-    parse_rss_items,
+    iter_rss_items,
     parsed_pubdate,
+    run_parser,
+    site_label,
 )
 
 SLEDCOM_RSS = "https://sledcom.ru/news/rss_verify/?main=1"
@@ -31,9 +34,16 @@ def get_recent_items(
         return out
     logger.debug("Successfully fetched Sledcom RSS")
 
-    items = parse_rss_items(content)
+    return run_parser(
+        parse_items, content, cutoff, stage="pre_parse", site=site_label(url)
+    )
 
-    for item in items:
+
+def parse_items(
+    content: str | bytes, cutoff: datetime.datetime
+) -> List[Dict[str, Union[str, int]]]:
+    out: List[Dict[str, Union[str, int]]] = []
+    for item in iter_rss_items(content):
         pub = (
             item.findtext("pubDate")
             or item.findtext("{http://purl.org/dc/elements/1.1/}date")
@@ -61,7 +71,7 @@ def get_recent_items(
             {
                 "title": clean_html(title),
                 "description": clean_html(description),
-                "link": link,
+                "link": canonicalize_url(link),
                 "timestamp_ms": int(
                     dt.astimezone(datetime.timezone.utc).timestamp() * 1000
                 ),
@@ -1,14 +1,157 @@
 import asyncio
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError
-from aiogram.types import InputMediaPhoto, InputMediaVideo
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import InputMediaPhoto, InputMediaVideo, Message
 from loguru import logger
 
+from newsreposter.core import media as media_check
+from newsreposter.core.cache import PersistentLRUCache
 from newsreposter.core.parsers import post_parsers
+from newsreposter.core.rate_limiter import TelegramRateLimiter, limited
 
 FULL_POST_MAX_LEN = 1024
+MESSAGE_MAX_LEN = 4096
+DIGEST_SEPARATOR = "\n\n"
+FILE_ID_CACHE_FILE = "file_id_cache.json"
+FILE_ID_CACHE_SIZE = 2000
+
+_file_id_cache: Optional[PersistentLRUCache] = None
+
+
+def get_file_id_cache() -> PersistentLRUCache:
+    # media url -> file_id of the copy Telegram already has
+    global _file_id_cache
+    if _file_id_cache is None:
+        _file_id_cache = PersistentLRUCache(
+            FILE_ID_CACHE_FILE, max_size=FILE_ID_CACHE_SIZE, autosave=False
+        )
+    return _file_id_cache
+
+
+def message_file_id(message: Message) -> Optional[str]:
+    if message.photo:
+        # the largest size; Telegram reuses the original upload for it
+        return message.photo[-1].file_id
+    if message.video:
+        return message.video.file_id
+    return None
+
+
+async def remember_file_ids(
+    media: Dict[str, str], urls: List[str], messages: List[Message]
+) -> None:
+    cache = get_file_id_cache()
+    stored = 0
+    for url, message in zip(urls, messages):
+        file_id = message_file_id(message)
+        if file_id and media.get(url) != file_id:
+            cache.put(url, file_id)
+            stored += 1
+    if stored:
+        await asyncio.to_thread(cache.save)
+    logger.debug("Stored {} file_ids, cache stats: {}", stored, cache.stats())
+
+
+async def forget_file_ids(media: Dict[str, str]) -> None:
+    # a cached file_id that Telegram rejects must not be reused
+    cache = get_file_id_cache()
+    stale = [url for url, ref in media.items() if ref != url]
+    for url in stale:
+        cache.pop(url)
+    if stale:
+        logger.warning("Dropped {} cached file_ids after a failed send", len(stale))
+        await asyncio.to_thread(cache.save)
+
+
+async def prefetch_post_data(item: Dict[str, Any]) -> Dict[str, List[str]]:
+    link = (item.get("link") or item.get("url") or "").strip()
+    if not link:
+        return {}
+    return await asyncio.to_thread(post_parsers.parse, link)
+
+
+async def prepare_post_item(item: Dict[str, Any], *, check_media: bool = True) -> None:
+    # runs concurrently for several queued items; the send itself stays ordered
+    if not item.get("post_data"):
+        item["post_data"] = await prefetch_post_data(item)
+    post_data = item["post_data"]
+    if not check_media or not isinstance(post_data, dict):
+        return
+    videos = list(post_data.get("video") or [])[:10]
+    photos = list(post_data.get("photo") or [])[:10]
+    if videos or photos:
+        # one broken url fails the whole album, catch that before sending
+        cache = get_file_id_cache()
+        post_data["video"], post_data["photo"] = await asyncio.gather(
+            media_check.validate_media(videos, media_check.VIDEO, cache),
+            media_check.validate_media(photos, media_check.PHOTO, cache),
+        )
+
+
+def format_short(title: str, link: str) -> str:
+    return f"<b>{title}</b>\n\n{link}"
+
+
+def digest_chunks(
+    items: List[Dict[str, Any]], max_len: int = MESSAGE_MAX_LEN
+) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    # as few messages as possible, each within Telegram's text limit, with the
+    # items each one covers; skipped items ride along with a neighbour
+    chunks: List[Tuple[str, List[Dict[str, Any]]]] = []
+    current = ""
+    covered: List[Dict[str, Any]] = []
+    for item in items:
+        title = (item.get("title") or "").strip()
+        link = (item.get("link") or item.get("url") or "").strip()
+        if not title or not link:
+            logger.warning("Skipping digest entry without title/link: {}", item)
+            covered.append(item)
+            continue
+        # cut the title, not the markup, so the HTML stays valid
+        room = max_len - len(format_short("", link))
+        entry = format_short(title[: max(room, 0)], link)
+        if current and len(current) + len(DIGEST_SEPARATOR) + len(entry) > max_len:
+            chunks.append((current, covered))
+            current, covered = "", []
+        current = current + DIGEST_SEPARATOR + entry if current else entry
+        covered.append(item)
+    if current:
+        chunks.append((current, covered))
+    elif covered and chunks:
+        chunks[-1][1].extend(covered)
+    return chunks
+
+
+def build_digests(
+    items: List[Dict[str, Any]], max_len: int = MESSAGE_MAX_LEN
+) -> List[str]:
+    return [text for text, _ in digest_chunks(items, max_len)]
+
+
+async def aiogram_post_digest(
+    items: List[Dict[str, Any]],
+    bot: Bot,
+    chat_id: int,
+    *,
+    limiter: Optional[TelegramRateLimiter] = None,
+    ack: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> None:
+    # ack is told after every message which items it covered, so a later
+    # failure does not send them again
+    for text, covered in digest_chunks(items):
+        await limited(
+            limiter,
+            chat_id,
+            1,
+            lambda: bot.send_message(
+                chat_id, text, parse_mode="HTML", disable_web_page_preview=True
+            ),
+        )
+        if ack:
+            ack(covered)
+    logger.info("Posted to TG (digest of {} items)", len(items))
 
 
 async def aiogram_post_item(
@@ -17,6 +160,7 @@ async def aiogram_post_item(
     chat_id: int,
     *,
     full_post_max_len: int = FULL_POST_MAX_LEN,
+    limiter: Optional[TelegramRateLimiter] = None,
 ) -> None:
     logger.debug("Processing item for posting: {}", item)
     title = (item.get("title") or "").strip()
@@ -30,7 +174,9 @@ async def aiogram_post_item(
         logger.error("Item missing link/url")
         raise ValueError("Item missing link/url")
 
-    post_data = await asyncio.to_thread(post_parsers.parse, link)
+    post_data = item.get("post_data")
+    if not post_data:
+        post_data = await asyncio.to_thread(post_parsers.parse, link)
 
     photos: List[str] = []
     videos: List[str] = []
@@ -53,29 +199,46 @@ async def aiogram_post_item(
     full_text = (
         f"<b>{title}</b>\n\n{description}\n\n{link}"
         if description
-        else f"<b>{title}</b>\n\n{link}"
+        else format_short(title, link)
     )
 
     if len(full_text) >= full_post_max_len:
         logger.debug("Full text is too big, using title and link only")
-        short_text = f"<b>{title}</b>\n\n{link}"
+        short_text = format_short(title, link)
         to_send = short_text
         disable_preview = True
     else:
         to_send = full_text
         disable_preview = False
 
+    # url -> what is sent for it: a cached file_id, or the url itself
+    media: Dict[str, str] = {}
+    if videos or photos:
+        cache = get_file_id_cache()
+        for url in (videos or photos)[:10]:
+            media[url] = cache.get(url) or url
+
     try:
         if videos:
+            videos = videos[:10]
             input_media = []
-            for i, v in enumerate(videos[:10]):
+            for i, v in enumerate(videos):
                 if i == 0:
                     input_media.append(
-                        InputMediaVideo(media=v, caption=to_send, parse_mode="HTML")
+                        InputMediaVideo(
+                            media=media[v], caption=to_send, parse_mode="HTML"
+                        )
                     )
                 else:
-                    input_media.append(InputMediaVideo(media=v))
-            await bot.send_media_group(chat_id, input_media)
+                    input_media.append(InputMediaVideo(media=media[v]))
+            # every album entry counts against the limits as a separate message
+            messages = await limited(
+                limiter,
+                chat_id,
+                len(input_media),
+                lambda: bot.send_media_group(chat_id, input_media),
+            )
+            await remember_file_ids(media, videos, messages)
             logger.info(
                 "Posted to TG (media_group, videos: {}): {}", len(videos), title
             )
@@ -83,36 +246,65 @@ async def aiogram_post_item(
 
         if photos:
             if len(photos) == 1:
-                await bot.send_photo(
-                    chat_id, photos[0], caption=to_send, parse_mode="HTML"
+                message = await limited(
+                    limiter,
+                    chat_id,
+                    1,
+                    lambda: bot.send_photo(
+                        chat_id, media[photos[0]], caption=to_send, parse_mode="HTML"
+                    ),
                 )
+                await remember_file_ids(media, photos, [message])
                 logger.info("Posted to TG (photo): {}", title)
             else:
+                photos = photos[:10]
                 input_media = []
-                for i, p in enumerate(photos[:10]):
+                for i, p in enumerate(photos):
                     if i == 0:
                         input_media.append(
-                            InputMediaPhoto(media=p, caption=to_send, parse_mode="HTML")
+                            InputMediaPhoto(
+                                media=media[p], caption=to_send, parse_mode="HTML"
+                            )
                         )
                     else:
-                        input_media.append(InputMediaPhoto(media=p))
-                await bot.send_media_group(chat_id, input_media)
+                        input_media.append(InputMediaPhoto(media=media[p]))
+                messages = await limited(
+                    limiter,
+                    chat_id,
+                    len(input_media),
+                    lambda: bot.send_media_group(chat_id, input_media),
+                )
+                await remember_file_ids(media, photos, messages)
                 logger.info(
                     "Posted to TG (media_group, photos: {}): {}", len(photos), title
                 )
             return
 
-        await bot.send_message(
+        await limited(
+            limiter,
             chat_id,
-            to_send,
-            parse_mode="HTML",
-            disable_web_page_preview=disable_preview,
+            1,
+            lambda: bot.send_message(
+                chat_id,
+                to_send,
+                parse_mode="HTML",
+                disable_web_page_preview=disable_preview,
+            ),
         )
         logger.info("Posted to TG (text only): {}", title)
 
+    except TelegramRetryAfter:
+        # still flooded after the limiter's retries, a fallback would fail too
+        raise
     except TelegramAPIError:
         logger.exception("Telegram API error while posting item: {}", title)
-        await bot.send_message(
-            chat_id, to_send, parse_mode="HTML", disable_web_page_preview=True
+        await forget_file_ids(media)
+        await limited(
+            limiter,
+            chat_id,
+            1,
+            lambda: bot.send_message(
+                chat_id, to_send, parse_mode="HTML", disable_web_page_preview=True
+            ),
         )
         logger.info("Posted to TG (text fallback after TelegramAPIError): {}", title)
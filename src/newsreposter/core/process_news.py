@@ -4,7 +4,7 @@ import os
 import pickle
 from datetime import datetime, timezone
 import re
-from typing import Any
+from typing import Any, Dict, List, Optional, Tuple
 
 import torch
 from loguru import logger
@@ -12,6 +12,8 @@ from sentence_transformers import SentenceTransformer, util
 from torch import Tensor
 from transformers import logging as hf_logging
 
+from newsreposter.core import metrics
+
 logger = logger.bind(filter_logger=True)
 
 CACHE_FILE = "cache.pkl"
@@ -53,33 +55,29 @@ def _to_tensor(x: Any, device: torch.device) -> Tensor:
     return t.to(device)
 
 
-def load_cache():
-    global cache
-    logger.debug("Loading cache from {}", CACHE_FILE)
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "rb") as f:
-                loaded = pickle.load(f)
-            for item in loaded:
-                emb = item.get("embedding")
-                if not torch.is_tensor(emb):
-                    emb = torch.as_tensor(emb)
-                item["embedding"] = emb.cpu().detach()
-            cache = loaded
-            logger.debug("Cache loaded successfully, {} items", len(cache))
-        except Exception as e:
-            logger.exception("Failed to load cache: {}", e)
-            cache = []
-    else:
+def _load_cache_file(path: str) -> list:
+    logger.debug("Loading cache from {}", path)
+    if not os.path.exists(path):
         logger.debug("Cache file does not exist, starting with empty cache")
-        cache = []
+        return []
+    try:
+        with open(path, "rb") as f:
+            loaded = pickle.load(f)
+        for item in loaded:
+            emb = item.get("embedding")
+            if not torch.is_tensor(emb):
+                emb = torch.as_tensor(emb)
+            item["embedding"] = emb.cpu().detach()
+        logger.debug("Cache loaded successfully, {} items", len(loaded))
+        return loaded
+    except Exception as e:
+        logger.exception("Failed to load cache: {}", e)
+        return []
 
 
-def save_cache():
-    logger.debug("Saving cache with {} items", len(cache))
-    rotate_cache()
+def _save_cache_file(path: str, entries: list):
     serializable = []
-    for item in cache:
+    for item in entries:
         emb = item["embedding"]
         if torch.is_tensor(emb):
             emb_np = emb.cpu().detach().numpy()
@@ -88,20 +86,18 @@ def save_cache():
         serializable.append(
             {"hash": item["hash"], "embedding": emb_np, "date": item["date"]}
         )
-    with open(CACHE_FILE, "wb") as f:
+    with open(path, "wb") as f:
         pickle.dump(serializable, f)
     logger.debug("Cache saved successfully")
 
 
-def rotate_cache():
-    global cache
-    if len(cache) > MAX_CACHE_SIZE:
-        logger.debug("Rotating cache: {} -> {}", len(cache), MAX_CACHE_SIZE)
-        cache = cache[-MAX_CACHE_SIZE:]
+def _is_duplicate_in(text_embedding: Tensor, entries: list, threshold: float) -> bool:
+    with metrics.span("dedup"):
+        return _check_duplicate(text_embedding, entries, threshold)
 
 
-def is_duplicate(text_embedding: Tensor) -> bool:
-    if not cache:
+def _check_duplicate(text_embedding: Tensor, entries: list, threshold: float) -> bool:
+    if not entries:
         return False
 
     if text_embedding.dim() == 1:
@@ -110,7 +106,7 @@ def is_duplicate(text_embedding: Tensor) -> bool:
         query = text_embedding
 
     device = query.device
-    cache_embeddings = [item["embedding"] for item in cache]
+    cache_embeddings = [item["embedding"] for item in entries]
     tensors = [_to_tensor(e, device) for e in cache_embeddings]
     try:
         cache_batch = torch.stack(tensors)
@@ -121,24 +117,67 @@ def is_duplicate(text_embedding: Tensor) -> bool:
     sim_scores = util.cos_sim(query, cache_batch)[0]
     max_score = float(sim_scores.max().cpu().item())
     logger.debug("Max similarity against cache: {}", max_score)
-    return max_score >= SIMILARITY_THRESHOLD
+    return max_score >= threshold
 
 
-def find_keywords(text: str) -> list[str]:
+def _find_keywords_in(text: str, keywords: list[str]) -> list[str]:
     found = []
-    for kw in KEYWORDS:
-        pattern = rf"\b{re.escape(kw.lower())}\b"
-        if re.search(pattern, text):
-            found.append(kw)
+    with metrics.span("keyword_match"):
+        for kw in keywords:
+            pattern = rf"\b{re.escape(kw.lower())}\b"
+            if re.search(pattern, text):
+                found.append(kw)
     return found
 
 
+def load_cache():
+    global cache
+    cache = _load_cache_file(CACHE_FILE)
+
+
+def save_cache():
+    logger.debug("Saving cache with {} items", len(cache))
+    rotate_cache()
+    _save_cache_file(CACHE_FILE, cache)
+
+
+def rotate_cache():
+    global cache
+    if len(cache) > MAX_CACHE_SIZE:
+        logger.debug("Rotating cache: {} -> {}", len(cache), MAX_CACHE_SIZE)
+        cache = cache[-MAX_CACHE_SIZE:]
+
+
+def is_duplicate(text_embedding: Tensor) -> bool:
+    return _is_duplicate_in(text_embedding, cache, SIMILARITY_THRESHOLD)
+
+
+def find_keywords(text: str) -> list[str]:
+    return _find_keywords_in(text, KEYWORDS)
+
+
+def _without_texts(entries: list, texts: List[str]) -> list:
+    hashes = {get_text_hash(text) for text in texts}
+    return [item for item in entries if item["hash"] not in hashes]
+
+
+def forget(texts: List[str]):
+    # undoes accepted texts that never made it into the queue, so they are
+    # not rejected as duplicates when retried
+    global cache
+    kept = _without_texts(cache, texts)
+    if len(kept) != len(cache):
+        cache = kept
+        save_cache()
+
+
 def process_news(text: str):
     global cache
     logger.debug("Processing news: {} chars", len(text))
 
     lower_text = text.lower()
-    embedding = model.encode(text, show_progress_bar=False, convert_to_tensor=True)
+    with metrics.span("encode"):
+        embedding = model.encode(text, show_progress_bar=False, convert_to_tensor=True)
 
     kw_found = find_keywords(lower_text)
     if not kw_found:
@@ -184,5 +223,140 @@ def process_news(text: str):
     return True, ",".join(kw_found) if kw_found else relevance
 
 
+class Channel:
+    # vocabulary, thresholds and dedup cache of one output channel
+    def __init__(
+        self,
+        name: str,
+        words_file: str = "words.json",
+        relevance_threshold: float = RELEVANCE_THRESHOLD,
+        similarity_threshold: float = SIMILARITY_THRESHOLD,
+        cache_file: Optional[str] = None,
+    ):
+        self.name = name
+        with open(words_file, "r", encoding="utf-8") as f:
+            self.keywords: list[str] = json.load(f)
+        self.keyword_embeddings = model.encode(
+            self.keywords, show_progress_bar=False, convert_to_tensor=True
+        )
+        self.relevance_threshold = relevance_threshold
+        self.similarity_threshold = similarity_threshold
+        self.cache_file = cache_file or f"cache.{name}.pkl"
+        self.cache = _load_cache_file(self.cache_file)
+        self.dirty = False
+
+    def decide(
+        self, text: str, embedding: Tensor, relevance_scores: Tensor
+    ) -> Tuple[bool, Any]:
+        # same rules as process_news, with this channel's vocabulary and cache
+        kw_found = _find_keywords_in(text.lower(), self.keywords)
+        relevance = None
+        if not kw_found:
+            relevance = float(relevance_scores.max().cpu().item())
+            if relevance < self.relevance_threshold:
+                e = (
+                    f"[{self.name}] Text not relevant "
+                    f"(text: {text}, score: {relevance:.4f})"
+                )
+                logger.debug(e)
+                return False, e
+
+        text_hash = get_text_hash(text)
+        if any(item["hash"] == text_hash for item in self.cache):
+            return False, f"[{self.name}] Text hash already in cache"
+        if _is_duplicate_in(embedding, self.cache, self.similarity_threshold):
+            return False, f"[{self.name}] Text is duplicate by embedding"
+
+        self.cache.append(
+            {
+                "hash": text_hash,
+                "embedding": embedding.cpu().detach(),
+                "date": datetime.now(tz=timezone.utc),
+            }
+        )
+        self.dirty = True
+        return True, ",".join(kw_found) if kw_found else relevance
+
+    def forget(self, texts: List[str]):
+        kept = _without_texts(self.cache, texts)
+        if len(kept) != len(self.cache):
+            self.cache = kept
+            self.dirty = True
+            self.save()
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.cache = self.cache[-MAX_CACHE_SIZE:]
+        _save_cache_file(self.cache_file, self.cache)
+        self.dirty = False
+
+
+def cache_sizes(channels: Optional[List[Channel]] = None) -> Dict[str, int]:
+    # entries per dedup cache: each channel's own, or the single global one
+    if channels:
+        return {ch.name: len(ch.cache) for ch in channels}
+    return {"default": len(cache)}
+
+
+def build_channels(configs: List[Dict[str, Any]]) -> List[Channel]:
+    # configs are ChannelConfig dumps; chat_id is for the poster, not the filter
+    return [
+        Channel(**{k: v for k, v in cfg.items() if k != "chat_id"}) for cfg in configs
+    ]
+
+
+_keyword_matrix: Optional[Tuple[Tuple[int, ...], Tensor, List[Tuple[int, int]]]] = None
+
+
+def keyword_matrix(channels: List[Channel]) -> Tuple[Tensor, List[Tuple[int, int]]]:
+    # every channel's keyword embeddings stacked, with each channel's row range
+    global _keyword_matrix
+    key = tuple(id(ch) for ch in channels)
+    if _keyword_matrix is None or _keyword_matrix[0] != key:
+        bounds = []
+        start = 0
+        for ch in channels:
+            bounds.append((start, start + len(ch.keywords)))
+            start += len(ch.keywords)
+        matrix = torch.cat([ch.keyword_embeddings for ch in channels])
+        _keyword_matrix = (key, matrix, bounds)
+    return _keyword_matrix[1], _keyword_matrix[2]
+
+
+def process_news_batch(
+    texts: List[str], channels: List[Channel]
+) -> List[List[Tuple[bool, Any]]]:
+    # one encode for all texts and one matmul against every channel's keywords
+    logger.debug("Processing {} texts for {} channels", len(texts), len(channels))
+    if not texts:
+        return []
+    with metrics.span("encode"):
+        embeddings = model.encode(
+            texts, show_progress_bar=False, convert_to_tensor=True
+        )
+    matrix, bounds = keyword_matrix(channels)
+    with metrics.span("keyword_match"):
+        scores = util.cos_sim(embeddings, matrix)
+    # a failed batch leaves the caches as they were, the caller retries it
+    sizes = [len(ch.cache) for ch in channels]
+    results = []
+    try:
+        for i, text in enumerate(texts):
+            results.append(
+                [
+                    ch.decide(text, embeddings[i], scores[i, start:end])
+                    for ch, (start, end) in zip(channels, bounds)
+                ]
+            )
+    except BaseException:
+        for ch, size in zip(channels, sizes):
+            del ch.cache[size:]
+        raise
+    for ch in channels:
+        ch.save()
+    return results
+
+
 load_cache()
 logger.debug("Initial cache size after load: {}", len(cache))
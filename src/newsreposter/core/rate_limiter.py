@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+from loguru import logger
+
+from newsreposter.core import metrics
+
+T = TypeVar("T")
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_MINUTE = 20
+CHAT_BURST = 3
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        self._refill(now)
+        # a request larger than the bucket waits for a full bucket and goes into debt
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens -= cost
+
+
+class TelegramRateLimiter:
+    def __init__(
+        self,
+        global_per_second: float = GLOBAL_MESSAGES_PER_SECOND,
+        chat_per_minute: float = CHAT_MESSAGES_PER_MINUTE,
+        chat_burst: float = CHAT_BURST,
+        max_retries: int = MAX_RETRY_AFTER_ATTEMPTS,
+    ):
+        self.chat_rate = chat_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_per_second, global_per_second)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._blocked_until: Dict[Any, float] = {}
+        self._chat_locks: Dict[Any, asyncio.Lock] = {}
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: Any, cost: int = 1):
+        # the per-chat lock keeps a chat's waiters in FIFO order so a big media
+        # group is not starved; other chats are not held up by it
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            chat = self._chat_bucket(chat_id)
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._blocked_until.get(chat_id, 0.0) - now,
+                    chat.wait_time(cost, now),
+                )
+                if wait <= 0:
+                    chat.consume(cost, now)
+                    break
+                logger.debug("Rate limit: waiting {:.2f}s for chat {}", wait, chat_id)
+                await asyncio.sleep(wait)
+            # reserve global tokens without awaiting in between: the bucket goes
+            # into debt, so later callers queue up behind this one
+            now = time.monotonic()
+            wait = self._global.wait_time(cost, now)
+            self._global.consume(cost, now)
+            if wait > 0:
+                logger.debug("Rate limit: waiting {:.2f}s for the global limit", wait)
+                await asyncio.sleep(wait)
+
+    def retry_after(self, chat_id: Any, seconds: float):
+        until = time.monotonic() + seconds
+        self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), until)
+        # whatever we believed about the bucket, Telegram disagrees
+        self._chat_bucket(chat_id).tokens = 0
+
+    async def call(
+        self, chat_id: Any, cost: int, func: Callable[[], Awaitable[T]]
+    ) -> T:
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, cost)
+            try:
+                return await func()
+            except TelegramRetryAfter as e:
+                attempt += 1
+                logger.warning(
+                    "Telegram asked to retry after {}s (chat {}, attempt {})",
+                    e.retry_after,
+                    chat_id,
+                    attempt,
+                )
+                self.retry_after(chat_id, e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+
+
+async def limited(
+    limiter: Optional[TelegramRateLimiter],
+    chat_id: Any,
+    cost: int,
+    func: Callable[[], Awaitable[T]],
+) -> T:
+    async def send() -> T:
+        # the Telegram round trip only, waiting for the limiter is not included
+        with metrics.span("send"):
+            return await func()
+
+    if limiter is None:
+        return await send()
+    return await limiter.call(chat_id, cost, send)
@@ -0,0 +1,306 @@
+import asyncio
+import importlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+OP_PROCESS_NEWS = 1
+OP_FILTER_BATCH = 2
+OP_FORGET = 3
+OP_CACHE_SIZES = 4
+
+# request: op (u8), payload length (u32), utf-8 text (a json list of texts
+# for OP_FILTER_BATCH, {"texts": [...], "channel": index} for OP_FORGET,
+# empty for OP_CACHE_SIZES)
+# response: allowed (u8), result kind (u8), payload length (u32), payload;
+# OP_FILTER_BATCH answers KIND_JSON with [allowed, info] per text and channel,
+# OP_CACHE_SIZES KIND_JSON with {channel: entries}, and any op answers
+# KIND_ERROR when the worker failed to decide
+REQUEST_HEADER = struct.Struct(">BI")
+RESPONSE_HEADER = struct.Struct(">BBI")
+FLOAT = struct.Struct(">d")
+
+KIND_NONE = 0
+KIND_STR = 1
+KIND_FLOAT = 2
+KIND_JSON = 3
+KIND_ERROR = 4
+
+# filtering writes the dedup cache, so only these are re-sent after the
+# connection drops mid-request
+IDEMPOTENT_OPS = {OP_FORGET, OP_CACHE_SIZES}
+
+CLIENT_TIMEOUT_SECONDS = 60
+
+
+class FilterWorkerError(RuntimeError):
+    # the worker could not decide; not a rejection
+    pass
+
+
+def encode_result(allowed: bool, info: Any) -> bytes:
+    if info is None:
+        kind, payload = KIND_NONE, b""
+    elif isinstance(info, float):
+        kind, payload = KIND_FLOAT, FLOAT.pack(info)
+    else:
+        kind, payload = KIND_STR, str(info).encode("utf-8")
+    return RESPONSE_HEADER.pack(int(bool(allowed)), kind, len(payload)) + payload
+
+
+def encode_json(obj: Any) -> bytes:
+    payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return RESPONSE_HEADER.pack(1, KIND_JSON, len(payload)) + payload
+
+
+def encode_error(message: str) -> bytes:
+    payload = message.encode("utf-8")
+    return RESPONSE_HEADER.pack(0, KIND_ERROR, len(payload)) + payload
+
+
+def decode_result(kind: int, payload: bytes) -> Any:
+    if kind == KIND_FLOAT:
+        return FLOAT.unpack(payload)[0]
+    if kind == KIND_STR:
+        return payload.decode("utf-8")
+    if kind == KIND_JSON:
+        return json.loads(payload)
+    return None
+
+
+def encode_batch(decisions: List[List[Tuple[bool, Any]]]) -> bytes:
+    return encode_json([[[bool(a), i] for a, i in row] for row in decisions])
+
+
+class FilterWorker:
+    def __init__(
+        self,
+        socket_path: str,
+        cpus: Optional[Sequence[int]] = None,
+        channels: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.socket_path = socket_path
+        self.cpus = list(cpus or [])
+        self.channel_configs = list(channels or [])
+        self._lock = asyncio.Lock()
+        self._process_news = None
+        self._filter_batch = None
+        self._forget = None
+        self._cache_sizes = None
+
+    def _pin_cpus(self):
+        if not self.cpus:
+            return
+        if not hasattr(os, "sched_setaffinity"):
+            logger.warning("CPU pinning is not supported on this platform")
+            return
+        os.sched_setaffinity(0, self.cpus)
+        logger.info("Filter worker pinned to CPUs {}", self.cpus)
+
+    def _load_model(self):
+        module = importlib.import_module("newsreposter.core.process_news")
+        if self.cpus:
+            import torch
+
+            torch.set_num_threads(len(self.cpus))
+        return module
+
+    async def serve_forever(self):
+        self._pin_cpus()
+        logger.info("Loading filter model...")
+        module = await asyncio.to_thread(self._load_model)
+        self._process_news = module.process_news
+        self._forget = lambda texts, channel: module.forget(texts)
+        self._cache_sizes = lambda: module.cache_sizes()
+        if self.channel_configs:
+            channels = await asyncio.to_thread(
+                module.build_channels, self.channel_configs
+            )
+            self._filter_batch = lambda texts: module.process_news_batch(
+                texts, channels
+            )
+            self._forget = lambda texts, channel: channels[channel].forget(texts)
+            self._cache_sizes = lambda: module.cache_sizes(channels)
+        logger.info("Filter model loaded")
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info("Filter worker listening on {}", self.socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        logger.debug("Filter client connected")
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                op, length = REQUEST_HEADER.unpack(header)
+                payload = await reader.readexactly(length)
+                if op == OP_FILTER_BATCH:
+                    writer.write(await self._handle_batch(payload))
+                    await writer.drain()
+                    continue
+                if op == OP_FORGET:
+                    writer.write(await self._handle_forget(payload))
+                    await writer.drain()
+                    continue
+                if op == OP_CACHE_SIZES:
+                    # len() of lists: no need to wait for a running filter call
+                    try:
+                        writer.write(encode_json(self._cache_sizes()))  # type: ignore
+                    except Exception as e:
+                        logger.exception("cache_sizes failed in filter worker")
+                        writer.write(encode_error(f"Filter worker error: {e}"))
+                    await writer.drain()
+                    continue
+                if op != OP_PROCESS_NEWS:
+                    logger.error("Unknown filter worker op: {}", op)
+                    break
+
+                text = payload.decode("utf-8")
+                try:
+                    async with self._lock:
+                        allowed, info = await asyncio.to_thread(
+                            self._process_news, text  # type: ignore
+                        )
+                except Exception as e:
+                    logger.exception("process_news failed in filter worker")
+                    writer.write(encode_error(f"Filter worker error: {e}"))
+                else:
+                    writer.write(encode_result(allowed, info))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            logger.debug("Filter client disconnected")
+
+    async def _handle_batch(self, payload: bytes) -> bytes:
+        texts = json.loads(payload)
+        if self._filter_batch is None:
+            logger.error("Batch filter request but no channels are configured")
+            return encode_error("Filter worker error: no channels configured")
+        try:
+            async with self._lock:
+                decisions = await asyncio.to_thread(self._filter_batch, texts)
+        except Exception as e:
+            logger.exception("process_news_batch failed in filter worker")
+            return encode_error(f"Filter worker error: {e}")
+        return encode_batch(decisions)
+
+
+    async def _handle_forget(self, payload: bytes) -> bytes:
+        request = json.loads(payload)
+        try:
+            async with self._lock:
+                await asyncio.to_thread(
+                    self._forget, request["texts"], request["channel"]  # type: ignore
+                )
+        except Exception as e:
+            logger.exception("forget failed in filter worker")
+            return encode_error(f"Filter worker error: {e}")
+        return encode_result(True, None)
+
+
+class FilterWorkerClient:
+    def __init__(self, socket_path: str, timeout: float = CLIENT_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        logger.debug("Connecting to filter worker at {}", self.socket_path)
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            self.socket_path
+        )
+
+    async def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def _request(self, op: int, payload: bytes) -> Tuple[bool, Any]:
+        if self._writer is None:
+            await self._connect()
+        assert self._reader is not None and self._writer is not None
+        self._writer.write(REQUEST_HEADER.pack(op, len(payload)) + payload)
+        await self._writer.drain()
+        header = await self._reader.readexactly(RESPONSE_HEADER.size)
+        allowed, kind, length = RESPONSE_HEADER.unpack(header)
+        body = await self._reader.readexactly(length)
+        if kind == KIND_ERROR:
+            raise FilterWorkerError(body.decode("utf-8"))
+        return bool(allowed), decode_result(kind, body)
+
+    async def process_news(self, text: str) -> Tuple[bool, Any]:
+        return await self._call(OP_PROCESS_NEWS, text.encode("utf-8"))
+
+    async def filter_batch(self, texts: List[str]) -> List[List[Tuple[bool, Any]]]:
+        payload = json.dumps(texts, ensure_ascii=False).encode("utf-8")
+        _, decisions = await self._call(OP_FILTER_BATCH, payload)
+        return [[(bool(a), i) for a, i in row] for row in decisions]
+
+    async def forget(self, texts: List[str], channel: int):
+        payload = json.dumps(
+            {"texts": texts, "channel": channel}, ensure_ascii=False
+        ).encode("utf-8")
+        await self._call(OP_FORGET, payload)
+
+    async def cache_sizes(self) -> Dict[str, int]:
+        _, sizes = await self._call(OP_CACHE_SIZES, b"")
+        return sizes
+
+    async def _call(self, op: int, payload: bytes) -> Tuple[bool, Any]:
+        async with self._lock:
+            if self._writer is not None and (
+                self._writer.is_closing() or self._reader.at_eof()  # type: ignore
+            ):
+                # the worker went away since the last request, nothing sent yet
+                logger.warning("Filter worker connection closed, reconnecting")
+                await self._reset()
+            for attempt in (1, 2):
+                try:
+                    return await asyncio.wait_for(
+                        self._request(op, payload), self.timeout
+                    )
+                except FilterWorkerError:
+                    # a complete answer, the connection is fine
+                    raise
+                except TimeoutError:
+                    await self._reset()
+                    raise
+                except (ConnectionError, asyncio.IncompleteReadError, OSError) as e:
+                    await self._reset()
+                    # the worker may have applied the request already
+                    if attempt == 2 or op not in IDEMPOTENT_OPS:
+                        raise
+                    logger.warning(
+                        "Filter worker connection lost ({}), reconnecting", e
+                    )
+                except BaseException:
+                    await self._reset()
+                    raise
+        raise RuntimeError("unreachable")
+
+    async def close(self):
+        async with self._lock:
+            await self._reset()
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sized, Tuple
+
+from aiohttp import web
+from loguru import logger
+
+from newsreposter.core import metrics
+from newsreposter.services.news_queue import NewsQueue
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+PREFIX = "newsreposter"
+LAG_INTERVAL_SECONDS = 0.5
+# the filter worker answers between filter calls, a scrape should not wait long
+DEDUP_SIZES_TIMEOUT_SECONDS = 2
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in sorted(labels.items())
+    )
+    return "{" + body + "}"
+
+
+def _number(value: float) -> str:
+    # exact: counters grow past what %g can show without rounding
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+
+def render(
+    depths: Dict[str, Dict[str, int]],
+    cache_sizes: Dict[str, int],
+    loop_lag: float,
+) -> str:
+    # text exposition format 0.0.4
+    lines: List[str] = []
+
+    _family(lines, "queue_depth", "gauge", "Queued items per channel and state.")
+    for channel, states in sorted(depths.items()):
+        for state, n in sorted(states.items()):
+            labels = _labels(channel=channel, state=state)
+            lines.append(f"{PREFIX}_queue_depth{labels} {n}")
+
+    _family(lines, "cache_size", "gauge", "Entries in in-process caches.")
+    for name, size in sorted(cache_sizes.items()):
+        lines.append(f"{PREFIX}_cache_size{_labels(cache=name)} {size}")
+
+    counters: Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], float]]] = {}
+    for (name, labels), value in metrics.counters().items():
+        counters.setdefault(name, []).append((labels, value))
+    for name, rows in sorted(counters.items()):
+        _family(lines, f"{name}_total", "counter", f"Total {name}.")
+        for labels, value in sorted(rows):
+            labels_text = _labels(**dict(labels))
+            lines.append(f"{PREFIX}_{name}_total{labels_text} {_number(value)}")
+
+    _family(lines, "posts_per_minute", "gauge", "Posts sent in the last minute.")
+    lines.append(f"{PREFIX}_posts_per_minute {metrics.posts_per_minute()}")
+
+    _family(lines, "event_loop_lag_seconds", "gauge", "Last event loop delay.")
+    lines.append(f"{PREFIX}_event_loop_lag_seconds {loop_lag:.6f}")
+
+    _family(
+        lines, "stage_seconds", "histogram", "Pipeline stage durations by site."
+    )
+    for (stage, site), hist in sorted(metrics.histograms().items()):
+        # bounds the histograms count exactly, exported in seconds
+        for le_ms in metrics.EXACT_BOUNDS_MS:
+            labels = _labels(stage=stage, site=site, le=f"{le_ms / 1000:g}")
+            count = hist.count_le(le_ms)
+            lines.append(f"{PREFIX}_stage_seconds_bucket{labels} {count}")
+        labels = _labels(stage=stage, site=site, le="+Inf")
+        lines.append(f"{PREFIX}_stage_seconds_bucket{labels} {hist.count}")
+        labels = _labels(stage=stage, site=site)
+        lines.append(f"{PREFIX}_stage_seconds_sum{labels} {hist.total_ms / 1000:.6f}")
+        lines.append(f"{PREFIX}_stage_seconds_count{labels} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(
+        self,
+        queues: Dict[str, NewsQueue],
+        caches: Optional[Dict[str, Sized]] = None,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        dedup_sizes: Optional[Callable[[], Awaitable[Dict[str, int]]]] = None,
+    ):
+        self.queues = queues
+        self.caches = caches or {}
+        # per channel; the dedup caches may live in the filter worker
+        self.dedup_sizes = dedup_sizes
+        self.host = host
+        self.port = port
+        self.loop_lag = 0.0
+        self._runner: Optional[web.AppRunner] = None
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def _collect(self, dedup: Dict[str, int]) -> str:
+        depths = {}
+        for channel, queue in self.queues.items():
+            try:
+                depths[channel] = queue.depths()
+            except Exception:
+                logger.exception("Failed to read queue depth for {}", channel)
+        sizes = {name: len(cache) for name, cache in self.caches.items()}
+        sizes.update({f"dedup.{channel}": n for channel, n in dedup.items()})
+        return render(depths, sizes, self.loop_lag)
+
+    async def _dedup(self) -> Dict[str, int]:
+        if self.dedup_sizes is None:
+            return {}
+        try:
+            return await asyncio.wait_for(
+                self.dedup_sizes(), DEDUP_SIZES_TIMEOUT_SECONDS
+            )
+        except Exception:
+            logger.exception("Failed to read dedup cache sizes")
+            return {}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        dedup = await self._dedup()
+        # directory scans and sqlite reads stay off the event loop
+        text = await asyncio.to_thread(self._collect, dedup)
+        # content_type= does not accept the version parameter
+        return web.Response(
+            body=text.encode("utf-8"), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def _watch_lag(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(LAG_INTERVAL_SECONDS)
+            self.loop_lag = max(0.0, time.monotonic() - start - LAG_INTERVAL_SECONDS)
+            metrics.record("event_loop_lag", self.loop_lag * 1000)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self._lag_task = asyncio.create_task(self._watch_lag())
+        logger.debug("Metrics server listening on {}:{}", self.host, self.port)
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
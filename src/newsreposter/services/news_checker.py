@@ -3,27 +3,157 @@ import importlib
 import inspect
 import json
 import os
+import sys
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import requests
 from loguru import logger
 
-from newsreposter.core import process_news
-from newsreposter.services.news_queue import FileQueue
+from newsreposter.core import metrics
+from newsreposter.core.cache import PersistentLRUCache
+from newsreposter.core.parsers import url_key
+from newsreposter.services.journal import GroupCommitJournal
+from newsreposter.services.news_queue import NewsQueue
+from newsreposter.services.prefetcher import ArticlePrefetcher
 
 ROTATION_INTERVAL_SECONDS = 60
 OVERLAP_MS = 1000
 INITIAL_BACKFILL_MS = 60 * 60 * 1000
 STATE_FILE = "state.json"
+SEEN_LINKS_FILE = "seen_links.json"
+SEEN_LINKS_MAX_SIZE = 20000
+SEEN_LINKS_TTL_SECONDS = 7 * 24 * 60 * 60
 PARSERS_PACKAGE = "newsreposter.core.parsers.pre_parsers"
+# 0 keeps queued items until they are posted
+ITEM_TTL_MS = 0
+# any keyword hit outranks a relevance-only match (cosine score, at most 1)
+KEYWORD_PRIORITY = 1.0
+KEYWORD_HIT_PRIORITY = 0.1
+MAX_KEYWORD_HITS = 5
+
+Decision = Tuple[bool, Any]
+NewsFilter = Callable[[str], Awaitable[Decision]]
+# decisions for each text, one per channel in ChannelTarget order
+BatchFilter = Callable[[List[str]], Awaitable[List[List[Decision]]]]
+# drops the dedup entries of texts one channel (by index) accepted but could
+# not enqueue; must be safe to repeat
+Forget = Callable[[List[str], int], Awaitable[Any]]
+
+
+async def process_news_in_process(text: str) -> Tuple[bool, Any]:
+    # imported lazily: loading the module loads the model
+    from newsreposter.core import process_news
+
+    return await asyncio.to_thread(process_news.process_news, text=text)
+
+
+async def forget_in_process(texts: List[str], channel: int = 0):
+    from newsreposter.core import process_news
+
+    await asyncio.to_thread(process_news.forget, texts)
+
+
+class InProcessFilter:
+    # the filter model in this process, with the calls of FilterWorkerClient
+    def __init__(self, channels: Optional[List[Dict[str, Any]]] = None):
+        self.channel_configs = list(channels or [])
+        self._channels = None
+
+    async def process_news(self, text: str) -> Decision:
+        return await process_news_in_process(text)
+
+    async def filter_batch(self, texts: List[str]) -> List[List[Decision]]:
+        from newsreposter.core import process_news
+
+        if self._channels is None:
+            self._channels = await asyncio.to_thread(
+                process_news.build_channels, self.channel_configs
+            )
+        return await asyncio.to_thread(
+            process_news.process_news_batch, texts, self._channels
+        )
+
+    async def forget(self, texts: List[str], channel: int):
+        if not self.channel_configs:
+            await forget_in_process(texts)
+        elif self._channels is not None:
+            await asyncio.to_thread(self._channels[channel].forget, texts)
+
+    async def cache_sizes(self) -> Dict[str, int]:
+        # no sizes before the first filter call rather than loading the model
+        module = sys.modules.get("newsreposter.core.process_news")
+        if module is None or (self.channel_configs and self._channels is None):
+            return {}
+        return module.cache_sizes(self._channels)
+
+
+@dataclass
+class ChannelTarget:
+    name: str
+    queue: NewsQueue
+    prefetcher: Optional[ArticlePrefetcher] = None
+
+
+def now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def item_priority(
+    filter_info: Any, site: str, source_priority: Optional[Dict[str, float]] = None
+) -> float:
+    # filter_info is what the news filter returned for an accepted item:
+    # comma-separated keyword hits, or the relevance score when there were none
+    if isinstance(filter_info, str) and filter_info:
+        hits = min(len(filter_info.split(",")), MAX_KEYWORD_HITS)
+        score = KEYWORD_PRIORITY + KEYWORD_HIT_PRIORITY * hits
+    elif isinstance(filter_info, (int, float)):
+        score = float(filter_info)
+    else:
+        score = 0.0
+    return round(score + (source_priority or {}).get(site, 0.0), 3)
 
 
 class NewsChecker:
-    def __init__(self, q: FileQueue):
+    def __init__(
+        self,
+        q: Optional[NewsQueue] = None,
+        news_filter: Optional[NewsFilter] = None,
+        prefetcher: Optional[ArticlePrefetcher] = None,
+        seen_links: Optional[PersistentLRUCache] = None,
+        journal: Optional[GroupCommitJournal] = None,
+        item_ttl_ms: Optional[int] = ITEM_TTL_MS,
+        source_priority: Optional[Dict[str, float]] = None,
+        targets: Optional[List[ChannelTarget]] = None,
+        batch_filter: Optional[BatchFilter] = None,
+        forget: Optional[Forget] = None,
+    ):
         self.lock = asyncio.Lock()
+        if targets is None:
+            if q is None:
+                raise ValueError("NewsChecker needs a queue or channel targets")
+            targets = [ChannelTarget("default", q, prefetcher)]
+        self.targets = targets
+        self.batch_filter = batch_filter
+        if forget is None and news_filter is None and batch_filter is None:
+            forget = forget_in_process
+        self.forget = forget
+        self.journal = journal
+        self.item_ttl_ms = item_ttl_ms
+        self.source_priority = source_priority or {}
         self._task = None
-        self.queue = q
+        self.queue = targets[0].queue
+        self.news_filter = news_filter or process_news_in_process
+        self.prefetcher = targets[0].prefetcher
+        if seen_links is None:
+            seen_links = PersistentLRUCache(
+                SEEN_LINKS_FILE,
+                max_size=SEEN_LINKS_MAX_SIZE,
+                ttl_seconds=SEEN_LINKS_TTL_SECONDS,
+                autosave=False,
+            )
+        self.seen_links = seen_links
         self.parsers = self._discover_parsers()
         self.site_names = list(self.parsers.keys())
         if not self.site_names:
@@ -56,6 +186,13 @@ class NewsChecker:
         return parsers
 
     def _load_state(self) -> Dict[str, Any]:
+        if self.journal:
+            # newer than the state file if we crashed before a checkpoint
+            records = self.journal.replay()
+            states = [r["state"] for r in records if r.get("op") == "state"]
+            if states:
+                logger.debug("State recovered from journal")
+                return states[-1]
         logger.debug("Loading state from {}", STATE_FILE)
         if os.path.exists(STATE_FILE):
             try:
@@ -68,14 +205,15 @@ class NewsChecker:
         logger.debug("State file not found, starting with empty state")
         return {"index": 0, "sites": {}}
 
-    def _save_state(self):
+    def _save_state(self, sync: bool = True):
         logger.debug("Saving state to {}", STATE_FILE)
         tmp = STATE_FILE + ".tmp"
         try:
             with open(tmp, "w", encoding="utf-8") as f:
                 json.dump(self.state, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
             os.replace(tmp, STATE_FILE)
             logger.debug("State saved successfully")
         except Exception:
@@ -88,6 +226,121 @@ class NewsChecker:
             except Exception:
                 logger.exception("Failed to remove temp state file {}", tmp)
 
+    async def _persist_state(self):
+        if not self.journal:
+            await asyncio.to_thread(self._save_state)
+            return
+        await self.journal.commit([{"op": "state", "state": self.state}])
+        await asyncio.to_thread(self._save_state, False)
+        await asyncio.to_thread(self.journal.maybe_checkpoint)
+
+    async def _filter(self, titles: List[str]) -> List[Optional[List[Decision]]]:
+        if self.batch_filter:
+            return list(await self.batch_filter(titles))
+        decisions: List[Optional[List[Decision]]] = []
+        for title in titles:
+            try:
+                decisions.append([await self.news_filter(title)])
+            except Exception:
+                logger.exception("News filter failed for {}", title)
+                decisions.append(None)
+        return decisions
+
+    async def _fan_out(
+        self,
+        site: str,
+        candidates: List[Tuple[str, str, Dict[str, Any]]],
+        now: int,
+        fetched_ms: int,
+    ) -> bool:
+        # one filter pass decides every candidate for every channel
+        try:
+            with metrics.span("filter", site):
+                decisions = await self._filter([title for _, title, _ in candidates])
+        except Exception:
+            logger.exception(
+                "News filter failed for site {}; leaving last_checked unchanged", site
+            )
+            return False
+        filtered_ms = now_ms()
+
+        ok = True
+        for i, target in enumerate(self.targets):
+            accepted = []
+            titles = []
+            for (key, title, it), decision in zip(candidates, decisions):
+                if not decision or not decision[i][0]:
+                    continue
+                titles.append(title)
+                item = dict(it)
+                item["source"] = site
+                # carried in the queued item so the poster can report freshness
+                item["stages"] = {"fetched": fetched_ms, "filtered": filtered_ms}
+                item["priority"] = item_priority(
+                    decision[i][1], site, self.source_priority
+                )
+                if self.item_ttl_ms:
+                    # counted from the fetch: some sources (fsb) only give a date,
+                    # so timestamp_ms can be many hours before publication
+                    item["expires_ms"] = fetched_ms + self.item_ttl_ms
+                accepted.append(item)
+            if not accepted:
+                continue
+            enqueued_ms = now_ms()
+            for item in accepted:
+                item["stages"]["enqueued"] = enqueued_ms
+            try:
+                # durable before last_checked moves past these items
+                with metrics.span("enqueue", site):
+                    refs = await target.queue.put_many(accepted)
+            except Exception:
+                logger.exception(
+                    "Enqueue failed for site {} to {}; leaving last_checked unchanged",
+                    site,
+                    target.name,
+                )
+                ok = False
+                # the filter has recorded these as seen, undo that for the retry
+                await self._forget(titles, i)
+                continue
+            if target.prefetcher:
+                for ref, item in zip(refs, accepted):
+                    target.prefetcher.submit(ref, item)
+            if len(self.targets) > 1:
+                logger.info(
+                    "Enqueued {} items from {} for {}", len(refs), site, target.name
+                )
+            else:
+                logger.info("Enqueued {} items from {}", len(refs), site)
+
+        if ok:
+            for (key, _, _), decision in zip(candidates, decisions):
+                if key and decision is not None:
+                    self.seen_links.put(key, now)
+        undecided = sum(1 for decision in decisions if decision is None)
+        if undecided:
+            logger.warning(
+                "{} items from {} left undecided; leaving last_checked unchanged",
+                undecided,
+                site,
+            )
+        return ok and not undecided
+
+    async def _forget(self, titles: List[str], channel: int):
+        if self.forget is None:
+            logger.warning(
+                "No filter rollback, {} titles will be retried as duplicates",
+                len(titles),
+            )
+            return
+        try:
+            await self.forget(titles, channel)
+        except Exception:
+            logger.exception(
+                "Filter rollback failed, {} titles will be retried as duplicates",
+                len(titles),
+            )
+
     async def start(self):
         logger.debug("Starting NewsChecker")
         self._task = asyncio.create_task(self.run())
@@ -119,7 +372,7 @@ class NewsChecker:
             get_recent = self.parsers[site]
             logger.debug("Checking news for site: {}", site)
 
-            now_ms_val = int(datetime.now(timezone.utc).timestamp() * 1000)
+            now_ms_val = now_ms()
             last_ms = self.state["sites"][site].get("last_checked") or (
                 now_ms_val - INITIAL_BACKFILL_MS
             )
@@ -129,14 +382,18 @@ class NewsChecker:
 
             items = None
             try:
-                if inspect.iscoroutinefunction(get_recent):
-                    items = await get_recent(milliseconds=ms_to_request)
-                else:
-                    items = await asyncio.to_thread(
-                        get_recent, milliseconds=ms_to_request
-                    )
+                with metrics.span("poll", site):
+                    if inspect.iscoroutinefunction(get_recent):
+                        items = await get_recent(milliseconds=ms_to_request)
+                    else:
+                        items = await asyncio.to_thread(
+                            get_recent, milliseconds=ms_to_request
+                        )
                 logger.debug("Got {} items from {}", len(items) if items else 0, site)
+                outcome = "ok" if items else "empty"
+                metrics.increment("polls", site=site, outcome=outcome)
             except Exception as e:
+                metrics.increment("polls", site=site, outcome="error")
                 if not isinstance(e, requests.RequestException):
                     logger.exception(
                         "Parser failed for site {}; leaving last_checked unchanged",
@@ -145,21 +402,23 @@ class NewsChecker:
                 else:
                     logger.error(f"Parser failed for site {site}: {e}")
                 self.state["index"] = (self.state["index"] + 1) % len(self.site_names)
-                self._save_state()
+                await self._persist_state()
                 return
 
+            fetched_ms = now_ms()
             items = items or []
             max_item_ms = None
-            enqueued = 0
+            candidates = []
+            candidate_keys = set()
             for it in items:
                 try:
                     if isinstance(it, dict):
-                        allowed = await asyncio.to_thread(
-                            process_news.process_news, text=it["title"]
-                        )
-                        if allowed[0]:
-                            enqueued += 1
-                            self.queue.enqueue(it)
+                        key = url_key(str(it.get("link") or ""))
+                        if key and (key in self.seen_links or key in candidate_keys):
+                            logger.debug("Link already seen, skipping: {}", key)
+                        else:
+                            candidates.append((key, it["title"], it))
+                            candidate_keys.add(key)
 
                         if "timestamp_ms" in it and it["timestamp_ms"] is not None:
                             ts = int(it["timestamp_ms"])
@@ -172,8 +431,16 @@ class NewsChecker:
                 except Exception:
                     logger.exception("Bad item from parser {}: {}", site, it)
 
-            if enqueued:
-                logger.info("Enqueued {} items from {}", enqueued, site)
+            if candidates and not await self._fan_out(
+                site, candidates, now_ms_val, fetched_ms
+            ):
+                # links stay unseen so the next pass retries them
+                await asyncio.to_thread(self.seen_links.save)
+                self.state["index"] = (self.state["index"] + 1) % len(self.site_names)
+                await self._persist_state()
+                return
+
+            await asyncio.to_thread(self.seen_links.save)
 
             if max_item_ms:
                 new_last = int(max_item_ms) + 1
@@ -183,4 +450,4 @@ class NewsChecker:
             logger.debug("Updated last_checked for {} to {}", site, new_last)
             self.state["sites"][site]["last_checked"] = int(new_last)
             self.state["index"] = (self.state["index"] + 1) % len(self.site_names)
-            self._save_state()
+            await self._persist_state()
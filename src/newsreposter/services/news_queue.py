@@ -1,50 +1,304 @@
 import asyncio
+import heapq
 import json
 import os
+import socket
+import threading
+import time
 import uuid
+from abc import ABC, abstractmethod
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, Optional
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    Union,
+)
 
 from loguru import logger
 
+from newsreposter.core import metrics
+from newsreposter.services.journal import GroupCommitJournal
+from newsreposter.services.retry import RetryPolicy, is_transient
+
 logger.debug("Initializing news_queue module")
 
 QUEUE_DIR = Path(__file__).parent.parent.parent.parent / "news_queue"
 NEW_DIR = QUEUE_DIR / "new"
 IN_PROGRESS_DIR = QUEUE_DIR / "in_progress"
 FAILED_DIR = QUEUE_DIR / "failed"
+PREFETCHED_DIR = QUEUE_DIR / "prefetched"
 MAX_PROCESS_PER_RUN = 1
+MAX_IN_FLIGHT = 1
+# how often new/ is rescanned for other writers' files once the index runs empty
+RESCAN_INTERVAL_SECONDS = 30
+LEASE_SECONDS = 10 * 60
+MAX_ATTEMPTS = 5
+SWEEP_INTERVAL_SECONDS = 60
+DIGEST_MAX_ITEMS = 10
+
+
+# a queued item is a file path for FileQueue and a row id for SqliteQueue
+ItemRef = Union[Path, int]
+
+
+class DigestCallback(Protocol):
+    # posts items as one or more messages; ack is called with the items of
+    # each message once it is sent, see aiogram_post_digest
+    def __call__(
+        self,
+        items: List[Dict[str, Any]],
+        *,
+        ack: Callable[[List[Dict[str, Any]]], None],
+    ) -> Awaitable[Any]: ...
+
+
+_owner: Optional[Tuple[int, str]] = None
+
+
+def process_start(pid: int) -> Optional[str]:
+    # clock ticks after boot (field 22 of /proc/<pid>/stat); None off Linux
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat.rsplit(")", 1)[-1].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+def make_owner() -> str:
+    # one per process, so every queue the process opens shares it; the start
+    # time tells a later process that got the same pid apart
+    global _owner
+    pid = os.getpid()
+    if _owner is None or _owner[0] != pid:
+        start = process_start(pid) or uuid.uuid4().hex[:8]
+        _owner = (pid, f"{socket.gethostname()}:{pid}:{start}")
+    return _owner[1]
+
+
+def owner_is_dead(owner: Optional[str], current: str) -> bool:
+    # only provable for owners on this host; elsewhere the lease has to expire
+    try:
+        host, pid, start = (owner or "").split(":")
+        pid_num = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        return False
+    if pid_num == os.getpid():
+        # same pid but another owner id: an earlier run of this container
+        return owner != current
+    try:
+        os.kill(pid_num, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    # the pid is alive, but it may have been reused by another process
+    running = process_start(pid_num)
+    return running is not None and start.isdigit() and running != start
+
+
+class NewsQueue(ABC):
+    max_attempts: int = MAX_ATTEMPTS
+
+    @abstractmethod
+    def enqueue(self, obj: Dict[str, Any]) -> ItemRef: ...
+
+    def enqueue_many(self, objs: List[Dict[str, Any]]) -> List[ItemRef]:
+        return [self.enqueue(obj) for obj in objs]
+
+    async def put_many(self, objs: List[Dict[str, Any]]) -> List[ItemRef]:
+        # durable once this returns; the blocking writes stay off the event loop
+        return await asyncio.to_thread(self.enqueue_many, objs)
+
+    @abstractmethod
+    def claim_one(self) -> Optional[ItemRef]: ...
+
+    @abstractmethod
+    def pending(self) -> Iterable[ItemRef]: ...
+
+    @abstractmethod
+    def has_post_data(self, ref: ItemRef) -> bool: ...
+
+    @abstractmethod
+    def attach_post_data(self, ref: ItemRef, post_data: Dict[str, Any]) -> bool: ...
+
+    @abstractmethod
+    def read(self, ref: ItemRef) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    def remove(self, ref: ItemRef): ...
+
+    async def flush(self):
+        # makes earlier removes durable; they already are unless journaled
+        pass
+
+    @abstractmethod
+    def mark_failed(self, ref: ItemRef): ...
+
+    @abstractmethod
+    def retry_later(self, ref: ItemRef, eligible_ms: int): ...
+
+    @abstractmethod
+    def attempts(self, ref: ItemRef) -> int: ...
+
+    def requeue_stranded(self) -> int:
+        return 0
+
+    def expire_stale(self) -> int:
+        return 0
+
+    def backlog(self) -> int:
+        return len(list(self.pending()))
 
+    def depths(self) -> Dict[str, int]:
+        # items per state (per directory for FileQueue); may touch the disk
+        return {"new": self.backlog()}
 
-class FileQueue:
-    def __init__(self, base_dir: Path = QUEUE_DIR):
+
+class FileQueue(NewsQueue):
+    def __init__(
+        self,
+        base_dir: Path = QUEUE_DIR,
+        journal: Optional[GroupCommitJournal] = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        owner: Optional[str] = None,
+    ):
         self.base = Path(base_dir)
+        self.journal = journal
+        self.lease_ms = int(lease_seconds * 1000)
+        self.max_attempts = max_attempts
+        self.owner = owner or make_owner()
         self.new = self.base / "new"
         self.in_progress = self.base / "in_progress"
         self.failed = self.base / "failed"
-        for d in (self.new, self.in_progress, self.failed):
+        self.prefetched = self.base / "prefetched"
+        # claim owner, time and attempt count per item, kept across requeues
+        self.leases = self.base / "leases"
+        # items waiting for their next attempt
+        self.retry = self.base / "retry"
+        # items that went stale before anyone posted them
+        self.expired = self.base / "expired"
+        dirs = (
+            self.new,
+            self.in_progress,
+            self.failed,
+            self.prefetched,
+            self.leases,
+            self.retry,
+            self.expired,
+        )
+        for d in dirs:
             d.mkdir(parents=True, exist_ok=True)
+        # min-heap of (-priority, name, expires_ms) for new/; names sort in
+        # enqueue order, so equal priorities are claimed oldest first
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, str, Optional[int]]] = []
+        self._indexed: Set[str] = set()
+        # min-heap of (eligible_ms, name) for retry/
+        self._delayed: List[Tuple[int, str]] = []
+        self._last_ts = 0
+        self._last_scan = 0.0
+        self.journal_key = self.base.name
+        self._unflushed_removes = False
+        if journal:
+            self._recover()
+        self._scan()
+        for p in self.retry.iterdir():
+            if p.suffix == ".json":
+                eligible_ms = self._read_lease(p.name).get("eligible_ms", 0)
+                self._delayed.append((eligible_ms, p.name))
+        heapq.heapify(self._delayed)
+
+    def _recover(self):
+        # journaled items whose file did not reach the disk before a crash
+        items: Dict[str, Any] = {}
+        for record in self.journal.replay():
+            # a journal can be shared by the queues of several channels
+            if record.get("queue", self.journal_key) != self.journal_key:
+                continue
+            if record.get("op") == "enqueue":
+                items[record["name"]] = record["item"]
+            elif record.get("op") == "remove":
+                items.pop(record["name"], None)
+        restored = 0
+        for name, item in items.items():
+            dirs = (self.new, self.in_progress, self.failed, self.retry, self.expired)
+            if any((d / name).exists() for d in dirs):
+                continue
+            self._write_file(self.new / name, item, sync=False)
+            restored += 1
+        if restored:
+            logger.warning("Restored {} queued items from the journal", restored)
+
+    def _scan(self):
+        # reads only files not indexed yet, i.e. everything at startup
+        entries = [
+            self._entry(p.name)
+            for p in self.new.iterdir()
+            if p.suffix == ".json" and p.name not in self._indexed
+        ]
+        with self._lock:
+            added = 0
+            for entry in entries:
+                if entry[1] not in self._indexed:
+                    self._indexed.add(entry[1])
+                    self._heap.append(entry)
+                    added += 1
+            if added:
+                heapq.heapify(self._heap)
+            self._last_scan = time.monotonic()
+        if added:
+            logger.debug("Indexed {} queued files", added)
+
+    def _entry(
+        self, name: str, obj: Optional[Dict[str, Any]] = None
+    ) -> Tuple[float, str, Optional[int]]:
+        if obj is None:
+            try:
+                with open(self.new / name, "r", encoding="utf-8") as f:
+                    obj = json.load(f)
+            except Exception:
+                # claiming it will fail loudly, no need to here
+                obj = {}
+        expires_ms = obj.get("expires_ms")
+        return (
+            -float(obj.get("priority") or 0),
+            name,
+            int(expires_ms) if expires_ms is not None else None,
+        )
 
     def _make_filename(self) -> str:
         ts = int(datetime.now(timezone.utc).timestamp() * 1000)
+        with self._lock:
+            # names must sort in enqueue order even within one millisecond
+            ts = max(ts, self._last_ts + 1)
+            self._last_ts = ts
         uid = uuid.uuid4().hex
         return f"{ts}-{uid}.json"
 
-    def enqueue(self, obj: Dict[str, Any]) -> Path:
-        logger.debug("Enqueueing item: {}", obj)
-        fname = self._make_filename()
-        tmp = self.new / (fname + ".tmp")
-        final = self.new / fname
+    def _write_file(self, final: Path, obj: Dict[str, Any], sync: bool = True):
+        tmp = final.with_name(final.name + ".tmp")
         data = json.dumps(obj, ensure_ascii=False, default=str)
         try:
             with open(tmp, "w", encoding="utf-8") as f:
                 f.write(data)
-                f.flush()
-                os.fsync(f.fileno())
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
             os.replace(tmp, final)
-            logger.debug("Enqueued news -> {}", final)
-            return final
         except Exception:
             logger.exception("Failed to enqueue item")
             try:
@@ -54,20 +308,121 @@ class FileQueue:
                 logger.exception("Failed to cleanup tmp file {}", tmp)
             raise
 
-    def _list_new_sorted(self) -> Iterable[Path]:
-        files = [p for p in self.new.iterdir() if p.is_file() and p.suffix == ".json"]
-        files.sort(key=lambda p: p.name)
-        return files
+    def _index(self, fname: str, obj: Optional[Dict[str, Any]] = None):
+        entry = self._entry(fname, obj)
+        with self._lock:
+            self._indexed.add(fname)
+            heapq.heappush(self._heap, entry)
+
+    def enqueue(self, obj: Dict[str, Any]) -> Path:
+        logger.debug("Enqueueing item: {}", obj)
+        fname = self._make_filename()
+        final = self.new / fname
+        self._write_file(final, obj)
+        self._index(fname, obj)
+        logger.debug("Enqueued news -> {}", final)
+        return final
+
+    async def put_many(self, objs: List[Dict[str, Any]]) -> List[Path]:
+        if not self.journal:
+            return await super().put_many(objs)
+        names = [self._make_filename() for _ in objs]
+        # one fsync of the journal covers the whole batch (and whatever else
+        # was committed in the same window); the files themselves are not synced
+        await self.journal.commit(
+            [
+                {
+                    "op": "enqueue",
+                    "queue": self.journal_key,
+                    "name": name,
+                    "item": obj,
+                }
+                for name, obj in zip(names, objs)
+            ]
+        )
+
+        def write_files():
+            for name, obj in zip(names, objs):
+                self._write_file(self.new / name, obj, sync=False)
+
+        await asyncio.to_thread(write_files)
+        for name, obj in zip(names, objs):
+            self._index(name, obj)
+        logger.debug("Enqueued {} items via journal", len(names))
+        await asyncio.to_thread(self.journal.maybe_checkpoint)
+        return [self.new / name for name in names]
+
+    def _pop_entry(self) -> Optional[Tuple[float, str, Optional[int]]]:
+        with self._lock:
+            if not self._heap:
+                return None
+            entry = heapq.heappop(self._heap)
+            self._indexed.discard(entry[1])
+            return entry
+
+    def _archive_expired(self, name: str) -> bool:
+        try:
+            os.replace(self.new / name, self.expired / name)
+        except FileNotFoundError:
+            return False
+        self._drop_post_data(self.new / name)
+        self._drop_lease(name)
+        return True
+
+    def expire_stale(self) -> int:
+        now = int(time.time() * 1000)
+        with self._lock:
+            stale = [e for e in self._heap if e[2] is not None and e[2] <= now]
+            if not stale:
+                return 0
+            self._heap = [e for e in self._heap if e[2] is None or e[2] > now]
+            heapq.heapify(self._heap)
+            for entry in stale:
+                self._indexed.discard(entry[1])
+        archived = sum(self._archive_expired(entry[1]) for entry in stale)
+        logger.info("Archived {} stale items", archived)
+        return archived
+
+    def _promote_due(self):
+        now = int(time.time() * 1000)
+        while True:
+            with self._lock:
+                if not self._delayed or self._delayed[0][0] > now:
+                    return
+                _, name = heapq.heappop(self._delayed)
+            try:
+                os.replace(self.retry / name, self.new / name)
+            except FileNotFoundError:
+                continue
+            self._index(name)
+            logger.debug("{} is due for another attempt", name)
 
     def claim_one(self) -> Optional[Path]:
         logger.debug("Claiming one item from queue")
-        for p in self._list_new_sorted():
-            target = self.in_progress / p.name
+        self._promote_due()
+        since_scan = time.monotonic() - self._last_scan
+        if not self._heap and since_scan >= RESCAN_INTERVAL_SECONDS:
+            self._scan()
+        now = int(time.time() * 1000)
+        while True:
+            entry = self._pop_entry()
+            if entry is None:
+                break
+            _, name, expires_ms = entry
+            if expires_ms is not None and expires_ms <= now:
+                if self._archive_expired(name):
+                    logger.info("Archived stale item {}", name)
+                continue
+            p = self.new / name
+            target = self.in_progress / name
             try:
                 os.replace(p, target)
+                lease = self._read_lease(name)
+                self._write_lease(name, lease.get("attempts", 0) + 1)
                 logger.debug("Claimed {} -> {}", p, target)
                 return target
             except FileNotFoundError:
+                # claimed or removed by someone else
                 continue
             except Exception:
                 logger.exception("Failed to claim {}", p)
@@ -75,10 +430,145 @@ class FileQueue:
         logger.debug("No items to claim")
         return None
 
+    def _read_lease(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(self.leases / name, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.exception("Failed to read lease for {}", name)
+            return {}
+
+    def _write_lease(self, name: str, attempts: int, **extra: Any):
+        lease = {
+            "owner": self.owner,
+            "claimed_ms": int(time.time() * 1000),
+            "attempts": attempts,
+            **extra,
+        }
+        tmp = self.leases / (name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(lease, f)
+            os.replace(tmp, self.leases / name)
+        except Exception:
+            # without a lease the item is requeued by mtime once it looks stale
+            logger.exception("Failed to write lease for {}", name)
+
+    def _drop_lease(self, name: str):
+        try:
+            (self.leases / name).unlink(missing_ok=True)
+        except Exception:
+            logger.exception("Failed to remove lease for {}", name)
+
+    def attempts(self, path: Path) -> int:
+        return self._read_lease(path.name).get("attempts", 0)
+
+    def retry_later(self, in_progress_path: Path, eligible_ms: int):
+        name = in_progress_path.name
+        attempts = self.attempts(in_progress_path)
+        self._write_lease(name, attempts, eligible_ms=eligible_ms)
+        try:
+            os.replace(in_progress_path, self.retry / name)
+        except Exception:
+            logger.exception("Failed to schedule retry for {}", name)
+            return
+        with self._lock:
+            heapq.heappush(self._delayed, (eligible_ms, name))
+        logger.info("Retrying {} at {}", name, eligible_ms)
+
+    def requeue_stranded(self) -> int:
+        # in_progress items whose claimer died or whose lease ran out
+        now = int(time.time() * 1000)
+        requeued = 0
+        for p in list(self.in_progress.iterdir()):
+            if p.suffix != ".json":
+                continue
+            lease = self._read_lease(p.name)
+            owner = lease.get("owner")
+            if owner == self.owner:
+                continue
+            try:
+                claimed_ms = lease.get("claimed_ms") or int(p.stat().st_mtime * 1000)
+            except FileNotFoundError:
+                continue
+            expired = now - claimed_ms >= self.lease_ms
+            if not expired and not owner_is_dead(owner, self.owner):
+                continue
+            if lease.get("attempts", 0) >= self.max_attempts:
+                logger.warning(
+                    "{} stranded after {} attempts", p.name, lease["attempts"]
+                )
+                self.mark_failed(p)
+                continue
+            try:
+                os.replace(p, self.new / p.name)
+            except FileNotFoundError:
+                continue
+            self._index(p.name)
+            requeued += 1
+        if requeued:
+            logger.warning("Requeued {} stranded items", requeued)
+        return requeued
+
+    def backlog(self) -> int:
+        return len(self._heap)
+
+    def depths(self) -> Dict[str, int]:
+        out = {}
+        for d in (self.new, self.in_progress, self.retry, self.failed, self.expired):
+            with os.scandir(d) as entries:
+                out[d.name] = sum(1 for e in entries if e.name.endswith(".json"))
+        return out
+
+    def pending(self) -> Iterable[Path]:
+        with self._lock:
+            entries = sorted(self._heap)
+        return [self.new / entry[1] for entry in entries]
+
+    def has_post_data(self, path: Path) -> bool:
+        return (self.prefetched / path.name).exists()
+
+    def attach_post_data(self, path: Path, post_data: Dict[str, Any]) -> bool:
+        sidecar = self.prefetched / path.name
+        tmp = self.prefetched / (path.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(post_data, f, ensure_ascii=False)
+            os.replace(tmp, sidecar)
+        except Exception:
+            logger.exception("Failed to store prefetched data for {}", path.name)
+            tmp.unlink(missing_ok=True)
+            return False
+        if not (self.new / path.name).exists() and not (
+            self.in_progress / path.name
+        ).exists():
+            # posted or failed while we were prefetching
+            sidecar.unlink(missing_ok=True)
+            return False
+        logger.debug("Stored prefetched data for {}", path.name)
+        return True
+
+    def _drop_post_data(self, path: Path):
+        try:
+            (self.prefetched / path.name).unlink(missing_ok=True)
+        except Exception:
+            logger.exception("Failed to remove prefetched data for {}", path.name)
+
     def read(self, in_progress_path: Path) -> Dict[str, Any]:
         logger.debug("Reading item from {}", in_progress_path)
         with open(in_progress_path, "r", encoding="utf-8") as f:
             data = json.load(f)
+        sidecar = self.prefetched / in_progress_path.name
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                data["post_data"] = json.load(f)
+            logger.debug("Using prefetched data for {}", in_progress_path.name)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("Failed to read prefetched data {}", sidecar)
         logger.debug("Item read successfully")
         return data
 
@@ -88,6 +578,24 @@ class FileQueue:
             logger.debug("Removed processed file {}", in_progress_path)
         except Exception:
             logger.exception("Failed to remove {}", in_progress_path)
+        if self.journal:
+            # so a crash before the next checkpoint does not bring it back;
+            # durable after the next flush
+            self._unflushed_removes = True
+            self.journal.note(
+                {
+                    "op": "remove",
+                    "queue": self.journal_key,
+                    "name": in_progress_path.name,
+                }
+            )
+        self._drop_post_data(in_progress_path)
+        self._drop_lease(in_progress_path.name)
+
+    async def flush(self):
+        if self.journal and self._unflushed_removes:
+            self._unflushed_removes = False
+            await self.journal.commit([])
 
     def mark_failed(self, in_progress_path: Path):
         dest = self.failed / in_progress_path.name
@@ -96,22 +604,57 @@ class FileQueue:
             logger.warning("Moved failed file to {}", dest)
         except Exception:
             logger.exception("Failed to move failed file {}", in_progress_path)
+        self._drop_post_data(in_progress_path)
+        self._drop_lease(in_progress_path.name)
+
+
+def record_posted(item: Dict[str, Any], claimed_ms: int):
+    stages = item.setdefault("stages", {})
+    stages["claimed"] = claimed_ms
+    stages["posted"] = int(time.time() * 1000)
+    source = item.get("source") or ""
+    metrics.record_post()
+    metrics.increment("posts", source=source)
+    if item.get("timestamp_ms"):
+        metrics.record_freshness(source, stages["posted"] - int(item["timestamp_ms"]))
+    if stages.get("enqueued"):
+        metrics.record("queued", claimed_ms - stages["enqueued"], source)
+    logger.debug("Item stages: published {}, {}", item.get("timestamp_ms"), stages)
 
 
 class QueuePoster:
     def __init__(
         self,
-        queue: FileQueue,
+        queue: NewsQueue,
         post_cb: Callable[[Dict[str, Any]], Any],
         interval_seconds: int = 60,
-        max_per_run: int = MAX_PROCESS_PER_RUN,
+        max_per_run: Optional[int] = MAX_PROCESS_PER_RUN,
+        prepare_cb: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        retry_policy: Optional[RetryPolicy] = None,
+        digest_cb: Optional[DigestCallback] = None,
+        digest_threshold: int = 0,
+        digest_max_items: int = DIGEST_MAX_ITEMS,
     ):
         self.queue = queue
         self.post_cb = post_cb
+        self.prepare_cb = prepare_cb
+        self.retry_policy = retry_policy
+        # above digest_threshold queued items, post titles and links in bulk
+        self.digest_cb = digest_cb
+        self.digest_threshold = digest_threshold
+        self.digest_max_items = digest_max_items
         self.interval = interval_seconds
         self.max_per_run = max_per_run
+        self.max_in_flight = max(1, max_in_flight)
         self._task: Optional[asyncio.Task] = None
         self._stopping = False
+        self._last_sweep = 0.0
+        # items are published in claim order, whatever order prepare finishes in
+        self._claimed_seq = 0
+        self._published_seq = 0
+        self._finished_seqs: Set[int] = set()
+        self._turn = asyncio.Condition()
 
     async def start(self):
         logger.debug("Starting QueuePoster")
@@ -119,6 +662,7 @@ class QueuePoster:
             logger.debug("QueuePoster already running")
             return
         self._stopping = False
+        self._sweep()
         self._task = asyncio.create_task(self._loop())
         logger.debug("QueuePoster started")
 
@@ -136,35 +680,151 @@ class QueuePoster:
 
     async def _process_once(self):
         logger.debug("Processing queue items")
-        processed = 0
-        while processed < self.max_per_run:
+        slots = asyncio.Semaphore(self.max_in_flight)
+        # every run waits for all of its items, so sequencing restarts from zero
+        self._claimed_seq = self._published_seq = 0
+        self._finished_seqs.clear()
+        tasks = []
+        claimed_count = 0
+        digested = 0
+        while self.digest_cb and self.queue.backlog() > self.digest_threshold:
+            if self.max_per_run is not None and claimed_count >= self.max_per_run:
+                break
+            n = await self._post_digest()
+            if not n:
+                break
+            digested += n
+            claimed_count += 1  # one message as far as pacing is concerned
+        while self.max_per_run is None or claimed_count < self.max_per_run:
+            await slots.acquire()
             claimed = self.queue.claim_one()
             if not claimed:
+                slots.release()
+                break
+            claimed_count += 1
+            seq = self._claimed_seq
+            self._claimed_seq += 1
+            tasks.append(asyncio.create_task(self._handle(seq, claimed, slots)))
+        results = await asyncio.gather(*tasks)
+        processed = digested + sum(results)
+        logger.debug("Processed {} items", processed)
+        return processed
+
+    async def _post_digest(self) -> int:
+        claimed: List[Tuple[ItemRef, Dict[str, Any]]] = []
+        while len(claimed) < self.digest_max_items:
+            ref = self.queue.claim_one()
+            if not ref:
                 break
+            try:
+                claimed.append((ref, self.queue.read(ref)))
+            except Exception:
+                logger.exception("Failed to read claimed file {}", ref)
+                self.queue.mark_failed(ref)
+        if not claimed:
+            return 0
+        claimed_ms = int(time.time() * 1000)
+        unsent = {id(item): ref for ref, item in claimed}
+
+        def ack(sent: List[Dict[str, Any]]):
+            for item in sent:
+                ref = unsent.pop(id(item), None)
+                if ref is not None:
+                    self.queue.remove(ref)
+                    record_posted(item, claimed_ms)
+
+        try:
+            await self.digest_cb([item for _, item in claimed], ack=ack)
+        except Exception as e:
+            # items of messages that did go out were acked already
+            logger.exception(
+                "Posting digest failed, {} of {} items unsent",
+                len(unsent),
+                len(claimed),
+            )
+            for ref in unsent.values():
+                self._handle_failure(ref, e)
+            await self.queue.flush()
+            return len(claimed) - len(unsent)
+        ack([item for _, item in claimed])
+        await self.queue.flush()
+        logger.info("Posted a digest of {} items", len(claimed))
+        return len(claimed)
+
+    async def _handle(
+        self, seq: int, claimed: ItemRef, slots: asyncio.Semaphore
+    ) -> bool:
+        try:
             try:
                 item = self.queue.read(claimed)
             except Exception:
                 logger.exception("Failed to read claimed file {}", claimed)
                 self.queue.mark_failed(claimed)
-                continue
+                return False
+            claimed_ms = int(time.time() * 1000)
 
+            if self.prepare_cb:
+                try:
+                    await self.prepare_cb(item)
+                except Exception:
+                    # post_cb can still publish from the queued item alone
+                    logger.exception("Preparing failed for {}", claimed)
+
+            async with self._turn:
+                await self._turn.wait_for(lambda: self._published_seq == seq)
             try:
                 logger.debug("Posting item: {}", item)
                 res = self.post_cb(item)
                 if asyncio.iscoroutine(res):
                     await res
                 self.queue.remove(claimed)
-                processed += 1
+                # a replayed enqueue must not bring back a published item
+                await self.queue.flush()
+                record_posted(item, claimed_ms)
                 logger.debug("Item posted successfully")
-            except Exception:
+                return True
+            except Exception as e:
                 logger.exception("Posting failed for {}", claimed)
-                self.queue.mark_failed(claimed)
-        logger.debug("Processed {} items", processed)
-        return processed
+                self._handle_failure(claimed, e)
+                return False
+        finally:
+            # items that failed before their turn are skipped once reached
+            async with self._turn:
+                self._finished_seqs.add(seq)
+                while self._published_seq in self._finished_seqs:
+                    self._finished_seqs.remove(self._published_seq)
+                    self._published_seq += 1
+                self._turn.notify_all()
+            slots.release()
+
+    def _sweep(self):
+        self._last_sweep = time.monotonic()
+        try:
+            self.queue.requeue_stranded()
+            self.queue.expire_stale()
+        except Exception:
+            logger.exception("Queue sweep failed")
+
+    def _handle_failure(self, claimed: ItemRef, exc: BaseException):
+        if self.retry_policy is None:
+            self.queue.mark_failed(claimed)
+            return
+        attempts = self.queue.attempts(claimed)
+        if not is_transient(exc):
+            logger.warning("Permanent failure for {}, not retrying", claimed)
+            self.queue.mark_failed(claimed)
+        elif attempts >= self.queue.max_attempts:
+            logger.warning("Giving up on {} after {} attempts", claimed, attempts)
+            self.queue.mark_failed(claimed)
+        else:
+            delay = self.retry_policy.delay(attempts, exc)
+            self.queue.retry_later(claimed, int((time.time() + delay) * 1000))
 
     async def _loop(self):
         logger.debug("QueuePoster loop started")
         while not self._stopping:
+            if time.monotonic() - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+                self._sweep()
             try:
                 n = await self._process_once()
                 if n:
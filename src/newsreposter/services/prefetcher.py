@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from loguru import logger
+
+from newsreposter.services.news_queue import ItemRef, NewsQueue
+
+MAX_CONCURRENT_PREFETCHES = 2
+
+
+class ArticlePrefetcher:
+    def __init__(
+        self,
+        queue: NewsQueue,
+        fetch_cb: Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]],
+        max_concurrency: int = MAX_CONCURRENT_PREFETCHES,
+    ):
+        self.queue = queue
+        self.fetch_cb = fetch_cb
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        logger.debug("Starting ArticlePrefetcher")
+        backlog = 0
+        for ref in self.queue.pending():
+            if self.queue.has_post_data(ref):
+                continue
+            try:
+                item = self.queue.read(ref)
+            except Exception:
+                logger.exception("Failed to read queued item {}", ref)
+                continue
+            self.submit(ref, item)
+            backlog += 1
+        if backlog:
+            logger.info("Prefetching {} queued articles", backlog)
+
+    async def stop(self):
+        logger.debug("Stopping ArticlePrefetcher")
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def submit(self, ref: ItemRef, item: Dict[str, Any]):
+        task = asyncio.create_task(self._prefetch(ref, item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, ref: ItemRef, item: Dict[str, Any]):
+        async with self._semaphore:
+            logger.debug("Prefetching article for {}", ref)
+            try:
+                post_data = await self.fetch_cb(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Prefetch failed for {}", item.get("link"))
+                return
+            if not post_data:
+                # let the poster try again when it publishes
+                logger.warning("Prefetch got no article data for {}", item.get("link"))
+                return
+            self.queue.attach_post_data(ref, post_data)
@@ -0,0 +1,40 @@
+import asyncio
+from dataclasses import dataclass
+
+import aiohttp
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+RETRY_BASE_SECONDS = 30
+RETRY_FACTOR = 2
+RETRY_MAX_SECONDS = 60 * 60
+
+TRANSIENT_ERRORS = (
+    TelegramRetryAfter,
+    TelegramNetworkError,
+    TelegramServerError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def is_transient(exc: BaseException) -> bool:
+    # anything else (bad request, forbidden chat, broken item) fails the same way again
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    base_seconds: float = RETRY_BASE_SECONDS
+    factor: float = RETRY_FACTOR
+    max_seconds: float = RETRY_MAX_SECONDS
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        delay = min(self.max_seconds, self.base_seconds * self.factor ** (attempt - 1))
+        if isinstance(exc, TelegramRetryAfter):
+            delay = max(delay, exc.retry_after)
+        return delay
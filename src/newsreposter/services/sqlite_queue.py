@@ -0,0 +1,402 @@
+import json
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from newsreposter.services.news_queue import (
+    MAX_ATTEMPTS,
+    QUEUE_DIR,
+    FileQueue,
+    NewsQueue,
+    make_owner,
+    owner_is_dead,
+)
+
+QUEUE_DB = Path(__file__).parent.parent.parent.parent / "news_queue.db"
+VISIBILITY_TIMEOUT_SECONDS = 10 * 60
+
+STATE_NEW = "new"
+STATE_IN_PROGRESS = "in_progress"
+STATE_FAILED = "failed"
+STATE_DELAYED = "delayed"
+STATE_EXPIRED = "expired"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    enqueued_ms INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'new',
+    lease_until_ms INTEGER,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    post_data TEXT
+);
+CREATE INDEX IF NOT EXISTS items_state_id ON items (state, id);
+CREATE INDEX IF NOT EXISTS items_state_lease ON items (state, lease_until_ms);
+"""
+
+# columns added after the first release, for databases created before them
+MIGRATIONS = {
+    "eligible_ms": "ALTER TABLE items ADD COLUMN eligible_ms INTEGER",
+    "priority": "ALTER TABLE items ADD COLUMN priority REAL NOT NULL DEFAULT 0",
+    "expires_ms": "ALTER TABLE items ADD COLUMN expires_ms INTEGER",
+}
+INDEXES = """
+CREATE INDEX IF NOT EXISTS items_state_eligible ON items (state, eligible_ms);
+CREATE INDEX IF NOT EXISTS items_claim ON items (state, priority DESC, id);
+CREATE INDEX IF NOT EXISTS items_state_expires ON items (state, expires_ms);
+"""
+
+
+def item_columns(obj: Dict[str, Any]) -> Tuple[float, Optional[int]]:
+    expires_ms = obj.get("expires_ms")
+    return (
+        float(obj.get("priority") or 0),
+        int(expires_ms) if expires_ms is not None else None,
+    )
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class SqliteQueue(NewsQueue):
+    def __init__(
+        self,
+        path: Path = QUEUE_DB,
+        visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS,
+        owner: Optional[str] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path = Path(path)
+        self.visibility_timeout_ms = int(visibility_timeout * 1000)
+        self.max_attempts = max_attempts
+        self.owner = owner or make_owner()
+        self._lock = threading.Lock()
+        # transactions are explicit, see _transaction
+        self._db = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs the WAL on every commit, so an acked enqueue_many is durable
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(items)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self._db.execute(statement)
+        self._db.executescript(INDEXES)
+        logger.debug("SqliteQueue opened at {}", self.path)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self, func):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def enqueue(self, obj: Dict[str, Any]) -> int:
+        return self.enqueue_many([obj])[0]
+
+    def enqueue_many(self, objs: List[Dict[str, Any]]) -> List[int]:
+        logger.debug("Enqueueing {} items", len(objs))
+        ts = now_ms()
+        rows = [
+            (ts, json.dumps(obj, ensure_ascii=False, default=str), *item_columns(obj))
+            for obj in objs
+        ]
+
+        def insert(db: sqlite3.Connection) -> List[int]:
+            ids = []
+            for row in rows:
+                cur = db.execute(
+                    "INSERT INTO items (enqueued_ms, data, priority, expires_ms)"
+                    " VALUES (?, ?, ?, ?)",
+                    row,
+                )
+                ids.append(cur.lastrowid)
+            return ids
+
+        ids = self._transaction(insert)
+        logger.debug("Enqueued items {}", ids)
+        return ids
+
+    def claim_one(self) -> Optional[int]:
+        logger.debug("Claiming one item from queue")
+        now = now_ms()
+
+        def claim(db: sqlite3.Connection) -> Optional[int]:
+            self._requeue_stranded(db, now)
+            db.execute(
+                "UPDATE items SET state = ? WHERE state = ? AND eligible_ms <= ?",
+                (STATE_NEW, STATE_DELAYED, now),
+            )
+            self._expire_stale(db, now)
+            row = db.execute(
+                "SELECT id FROM items WHERE state = ?"
+                " ORDER BY priority DESC, id LIMIT 1",
+                (STATE_NEW,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE items SET state = ?, owner = ?, lease_until_ms = ?,"
+                " attempts = attempts + 1 WHERE id = ?",
+                (
+                    STATE_IN_PROGRESS,
+                    self.owner,
+                    now + self.visibility_timeout_ms,
+                    row[0],
+                ),
+            )
+            return row[0]
+
+        item_id = self._transaction(claim)
+        if item_id is None:
+            logger.debug("No items to claim")
+        else:
+            logger.debug("Claimed item {}", item_id)
+        return item_id
+
+    def _requeue_stranded(self, db: sqlite3.Connection, now: int) -> int:
+        rows = db.execute(
+            "SELECT id, owner, lease_until_ms, attempts FROM items WHERE state = ?",
+            (STATE_IN_PROGRESS,),
+        ).fetchall()
+        requeued = 0
+        for item_id, owner, lease_until_ms, attempts in rows:
+            if owner == self.owner:
+                continue
+            expired = lease_until_ms is None or lease_until_ms < now
+            if not expired and not owner_is_dead(owner, self.owner):
+                continue
+            state = STATE_NEW if attempts < self.max_attempts else STATE_FAILED
+            db.execute(
+                "UPDATE items SET state = ?, owner = NULL, lease_until_ms = NULL"
+                " WHERE id = ?",
+                (state, item_id),
+            )
+            if state == STATE_FAILED:
+                logger.warning("Item {} stranded after {} attempts", item_id, attempts)
+            else:
+                requeued += 1
+        if requeued:
+            logger.warning("Requeued {} stranded items", requeued)
+        return requeued
+
+    def _expire_stale(self, db: sqlite3.Connection, now: int) -> int:
+        expired = db.execute(
+            "UPDATE items SET state = ?, post_data = NULL"
+            " WHERE state = ? AND expires_ms <= ?",
+            (STATE_EXPIRED, STATE_NEW, now),
+        ).rowcount
+        if expired:
+            logger.info("Archived {} stale items", expired)
+        return expired
+
+    def expire_stale(self) -> int:
+        return self._transaction(lambda db: self._expire_stale(db, now_ms()))
+
+    def requeue_stranded(self) -> int:
+        return self._transaction(lambda db: self._requeue_stranded(db, now_ms()))
+
+    def retry_later(self, ref: int, eligible_ms: int):
+        with self._lock:
+            self._db.execute(
+                "UPDATE items SET state = ?, eligible_ms = ?, owner = NULL,"
+                " lease_until_ms = NULL WHERE id = ?",
+                (STATE_DELAYED, eligible_ms, ref),
+            )
+        logger.info("Retrying item {} at {}", ref, eligible_ms)
+
+    def attempts(self, ref: int) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts FROM items WHERE id = ?", (ref,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def backlog(self) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM items WHERE state = ?", (STATE_NEW,)
+            ).fetchone()
+        return row[0]
+
+    def depths(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM items GROUP BY state"
+            ).fetchall()
+        out = {
+            state: 0
+            for state in (
+                STATE_NEW,
+                STATE_IN_PROGRESS,
+                STATE_DELAYED,
+                STATE_FAILED,
+                STATE_EXPIRED,
+            )
+        }
+        out.update(dict(rows))
+        return out
+
+    def pending(self) -> Iterable[int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM items WHERE state = ? ORDER BY priority DESC, id",
+                (STATE_NEW,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def has_post_data(self, ref: int) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT post_data IS NOT NULL FROM items WHERE id = ?", (ref,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def attach_post_data(self, ref: int, post_data: Dict[str, Any]) -> bool:
+        data = json.dumps(post_data, ensure_ascii=False)
+        with self._lock:
+            # autocommit: a single statement is its own transaction
+            updated = self._db.execute(
+                "UPDATE items SET post_data = ? WHERE id = ? AND state IN (?, ?)",
+                (data, ref, STATE_NEW, STATE_IN_PROGRESS),
+            ).rowcount
+        if updated:
+            logger.debug("Stored prefetched data for {}", ref)
+        return bool(updated)
+
+    def read(self, ref: int) -> Dict[str, Any]:
+        logger.debug("Reading item {}", ref)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, post_data FROM items WHERE id = ?", (ref,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(ref)
+        data = json.loads(row[0])
+        if row[1]:
+            data["post_data"] = json.loads(row[1])
+        return data
+
+    def remove(self, ref: int):
+        with self._lock:
+            self._db.execute("DELETE FROM items WHERE id = ?", (ref,))
+        logger.debug("Removed processed item {}", ref)
+
+    def mark_failed(self, ref: int):
+        with self._lock:
+            self._db.execute(
+                "UPDATE items SET state = ?, owner = NULL, lease_until_ms = NULL"
+                " WHERE id = ?",
+                (STATE_FAILED, ref),
+            )
+        logger.warning("Marked item {} as failed", ref)
+
+
+def migrate_file_queue(source: FileQueue, target: SqliteQueue) -> int:
+    # in_progress files were stranded by a crash, so they go back to new
+    states = [
+        (source.in_progress, STATE_NEW),
+        (source.new, STATE_NEW),
+        (source.retry, STATE_DELAYED),
+        (source.failed, STATE_FAILED),
+        (source.expired, STATE_EXPIRED),
+    ]
+    sources = [
+        (p, state)
+        for d, state in states
+        for p in d.iterdir()
+        if p.is_file() and p.suffix == ".json"
+    ]
+    if not sources:
+        return 0
+    # file names start with the enqueue timestamp, keep that order
+    sources.sort(key=lambda entry: entry[0].name)
+
+    rows = []
+    migrated = []
+    for p, state in sources:
+        try:
+            data = p.read_text(encoding="utf-8")
+            enqueued_ms = int(p.name.split("-", 1)[0])
+            columns = item_columns(json.loads(data))
+        except Exception:
+            logger.exception("Skipping unreadable queue file {}", p)
+            continue
+        sidecar = source.prefetched / p.name
+        post_data = sidecar.read_text(encoding="utf-8") if sidecar.exists() else None
+        # attempts and retry times live in the lease records
+        lease = source._read_lease(p.name)
+        eligible_ms = lease.get("eligible_ms", 0) if state == STATE_DELAYED else None
+        rows.append(
+            (
+                enqueued_ms,
+                state,
+                data,
+                post_data,
+                int(lease.get("attempts", 0)),
+                eligible_ms,
+                *columns,
+            )
+        )
+        migrated.append(p)
+
+    def insert(db: sqlite3.Connection):
+        db.executemany(
+            "INSERT INTO items (enqueued_ms, state, data, post_data, attempts,"
+            " eligible_ms, priority, expires_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    target._transaction(insert)
+    for p in migrated:
+        p.unlink(missing_ok=True)
+        (source.prefetched / p.name).unlink(missing_ok=True)
+        (source.leases / p.name).unlink(missing_ok=True)
+    logger.info(
+        "Imported {} items from {} into {}", len(rows), source.base, target.path
+    )
+    return len(rows)
+
+
+def _file_queue_items(base: Path) -> List[Path]:
+    # leftover item files, found without creating the queue directories
+    items = []
+    for state in ("in_progress", "new", "retry", "failed", "expired"):
+        d = base / state
+        if d.is_dir():
+            items += [p for p in d.iterdir() if p.is_file() and p.suffix == ".json"]
+    return items
+
+
+def migrate_file_queue_dir(target: SqliteQueue, base: Path = QUEUE_DIR) -> int:
+    # one-off import on the first sqlite start; the emptied directory is removed
+    # so later starts skip this with a single stat
+    if not base.is_dir():
+        return 0
+    migrated = 0
+    if _file_queue_items(base):
+        migrated = migrate_file_queue(FileQueue(base), target)
+    left = _file_queue_items(base)
+    if left:
+        logger.warning("{} unreadable queue files left in {}", len(left), base)
+    else:
+        shutil.rmtree(base, ignore_errors=True)
+    return migrated
@@ -0,0 +1,114 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from newsreposter.core.cache import PersistentLRUCache
+from newsreposter.core.parsers import post_parsers
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = PersistentLRUCache(path, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+    assert "b" not in cache
+
+    reloaded = PersistentLRUCache(path, max_size=2)
+    assert reloaded.get("a") == 1
+    assert reloaded.get("c") == 3
+    assert reloaded.get("b") is None
+
+
+def test_ttl_and_hit_rate(tmp_path, monkeypatch):
+    cache = PersistentLRUCache(None, max_size=10, ttl_seconds=60)
+    cache.put("a", {"description": ["x"]})
+    assert cache.get("a") == {"description": ["x"]}
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_post_parsers_parse_uses_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_route(link):
+        calls.append(link)
+        return lambda: {"description": ["text"]}
+
+    monkeypatch.setattr(post_parsers, "route", fake_route)
+    monkeypatch.setattr(
+        post_parsers,
+        "_article_cache",
+        PersistentLRUCache(str(tmp_path / "articles.json"), max_size=10),
+    )
+    url = "https://ria.ru/20251019/zaderzhanie-2049000001.html"
+    assert post_parsers.parse(url) == {"description": ["text"]}
+    assert post_parsers.parse(url) == {"description": ["text"]}
+    assert calls == [url]
+
+
+@pytest.mark.asyncio
+async def test_posts_reuse_telegram_file_ids(tmp_path, monkeypatch):
+    from aiogram.exceptions import TelegramBadRequest
+
+    from newsreposter.core import post
+
+    cache = PersistentLRUCache(str(tmp_path / "file_ids.json"), 10, autosave=False)
+    monkeypatch.setattr(post, "_file_id_cache", cache)
+    sent = []
+
+    class FakeBot:
+        fail = False
+
+        async def send_photo(self, chat_id, photo, **kwargs):
+            sent.append(photo)
+            if self.fail:
+                raise TelegramBadRequest(method=None, message="wrong file id")
+            size = SimpleNamespace(file_id="id-1")
+            return SimpleNamespace(photo=[size], video=None)
+
+        async def send_message(self, chat_id, text, **kwargs):
+            sent.append("text")
+
+    bot = FakeBot()
+    item = {
+        "title": "t",
+        "link": "https://ria.ru/1",
+        "post_data": {"photo": ["https://ria.ru/p.jpg"], "description": []},
+    }
+    await post.aiogram_post_item(item, bot, 1)  # type: ignore
+    await post.aiogram_post_item(item, bot, 2)  # type: ignore
+    assert sent == ["https://ria.ru/p.jpg", "id-1"]
+    assert cache.hits == 1
+    assert PersistentLRUCache(cache.path, 10).get("https://ria.ru/p.jpg") == "id-1"
+
+    bot.fail = True
+    await post.aiogram_post_item(item, bot, 3)  # type: ignore
+    assert sent[-2:] == ["id-1", "text"]
+    assert "https://ria.ru/p.jpg" not in cache
+
+
+def test_concurrent_saves_keep_the_newest_entries(tmp_path):
+    import threading
+
+    path = str(tmp_path / "cache.json")
+    cache = PersistentLRUCache(path, max_size=1000, autosave=False)
+
+    def writer(n):
+        for i in range(50):
+            cache.put(f"{n}-{i}", i)
+            cache.save()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(PersistentLRUCache(path, max_size=1000)) == 200
+    assert [p.name for p in tmp_path.iterdir()] == ["cache.json"]
@@ -0,0 +1,30 @@
+import html
+import json
+import re
+from pathlib import Path
+
+import pytest
+
+from newsreposter.core.parsers import _clean_html_soup, clean_html
+
+CORPUS = json.loads(
+    (Path(__file__).parent / "fixtures" / "clean_html_corpus.json").read_text(
+        encoding="utf-8"
+    )
+)
+
+
+def soup_only_clean_html(text: str) -> str:
+    if not text:
+        return ""
+    clean_text = _clean_html_soup(html.unescape(text))
+    return re.sub(r"\s+", " ", clean_text).strip()
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_clean_html_matches_soup_path(text):
+    assert clean_html(text) == soup_only_clean_html(text)
+
+
+def test_clean_html_drops_scripts():
+    assert clean_html("<p>a</p><script>b()</script><p>c</p>") == "a c"
@@ -0,0 +1,79 @@
+import pytest
+
+from newsreposter.core.post import build_digests, digest_chunks, format_short
+from newsreposter.services.news_queue import FileQueue, QueuePoster
+
+
+def test_build_digests_respects_message_limit():
+    items = [
+        {"title": f"Заголовок {i} " + "x" * 150, "link": f"https://ria.ru/{i}"}
+        for i in range(40)
+    ]
+    messages = build_digests(items)
+    assert len(messages) > 1
+    assert all(len(m) <= 4096 for m in messages)
+    assert "\n\n".join(messages).count("<b>") == 40
+    assert messages[0].startswith(format_short(items[0]["title"], items[0]["link"]))
+
+
+@pytest.mark.asyncio
+async def test_poster_switches_to_digests_above_threshold(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    for i in range(7):
+        q.enqueue({"title": f"t{i}", "link": f"https://ria.ru/{i}"})
+    digests = []
+    singles = []
+
+    async def post(item):
+        singles.append(item["title"])
+
+    async def digest(items, ack=None):
+        digests.append([it["title"] for it in items])
+
+    poster = QueuePoster(
+        q,
+        post,
+        max_per_run=None,
+        digest_cb=digest,
+        digest_threshold=2,
+        digest_max_items=3,
+    )
+    assert await poster._process_once() == 7
+    assert digests == [["t0", "t1", "t2"], ["t3", "t4", "t5"]]
+    assert singles == ["t6"]
+
+
+def test_long_title_is_cut_before_formatting():
+    link = "https://ria.ru/1"
+    messages = build_digests([{"title": "x" * 200, "link": link}], max_len=100)
+    assert len(messages) == 1
+    assert len(messages[0]) <= 100
+    assert messages[0].endswith(format_short("", link)[len("<b></b>") :])
+    assert "</b>" in messages[0]
+
+
+@pytest.mark.asyncio
+async def test_failed_digest_message_retries_only_unsent_items(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    for i in range(4):
+        q.enqueue({"title": f"t{i} " + "x" * 60, "link": f"https://ria.ru/{i}"})
+    sent = []
+
+    async def digest(items, ack=None):
+        for n, (text, covered) in enumerate(digest_chunks(items, max_len=200)):
+            if n == 1:
+                raise RuntimeError("flood")
+            sent.append(text)
+            ack(covered)
+
+    async def post(item):
+        raise AssertionError("not expected")
+
+    poster = QueuePoster(
+        q, post, max_per_run=None, digest_cb=digest, digest_threshold=1
+    )
+    assert await poster._process_once() == 2
+    assert len(sent) == 1
+    unsent = list(q.retry.iterdir()) + list(q.failed.iterdir())
+    assert len(unsent) == 2
+    assert not list(q.new.iterdir()) and not list(q.in_progress.iterdir())
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from newsreposter.services.filter_worker import (
+    REQUEST_HEADER,
+    FilterWorker,
+    FilterWorkerClient,
+    FilterWorkerError,
+    encode_result,
+)
+
+
+def fake_process_news(text: str):
+    if "кража" in text:
+        return True, "кража"
+    if "score" in text:
+        return True, 0.875
+    return False, f"Text not relevant (text: {text})"
+
+
+@pytest.mark.asyncio
+async def test_client_roundtrip(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = FilterWorker(socket_path)
+    worker._process_news = fake_process_news  # type: ignore
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+
+    client = FilterWorkerClient(socket_path)
+    try:
+        assert await client.process_news("кража века") == (True, "кража")
+        assert await client.process_news("score") == (True, 0.875)
+        allowed, reason = await client.process_news("погода")
+        assert not allowed and "погода" in reason
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_client_reconnects_after_worker_restart(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = FilterWorker(socket_path)
+    worker._process_news = fake_process_news  # type: ignore
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+
+    client = FilterWorkerClient(socket_path)
+    assert (await client.process_news("кража"))[0]
+
+    assert client._writer is not None
+    client._writer.close()
+    server.close()
+    await server.wait_closed()
+
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+    try:
+        assert (await client.process_news("кража"))[0]
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_client_batch_roundtrip(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = FilterWorker(socket_path)
+    worker._process_news = fake_process_news  # type: ignore
+    worker._filter_batch = lambda texts: [  # type: ignore
+        [fake_process_news(t), (False, None)] for t in texts
+    ]
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+
+    client = FilterWorkerClient(socket_path)
+    try:
+        decisions = await client.filter_batch(["кража века", "score"])
+        assert decisions == [
+            [(True, "кража"), (False, None)],
+            [(True, 0.875), (False, None)],
+        ]
+        assert await client.process_news("кража") == (True, "кража")
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_client_forget_and_cache_sizes(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = FilterWorker(socket_path)
+    forgotten = []
+
+    def forget(texts, channel):
+        forgotten.append((texts, channel))
+
+    worker._forget = forget  # type: ignore
+    worker._cache_sizes = lambda: {"crime": 2, "city": 0}  # type: ignore
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+
+    client = FilterWorkerClient(socket_path)
+    try:
+        await client.forget(["кража века"], 1)
+        assert forgotten == [(["кража века"], 1)]
+        assert await client.cache_sizes() == {"crime": 2, "city": 0}
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_worker_failure_is_an_error_not_a_reject(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = FilterWorker(socket_path)
+
+    def broken(text):
+        if text == "boom":
+            raise RuntimeError("model gone")
+        return fake_process_news(text)
+
+    worker._process_news = broken  # type: ignore
+    server = await asyncio.start_unix_server(worker._handle, path=socket_path)
+
+    client = FilterWorkerClient(socket_path)
+    try:
+        with pytest.raises(FilterWorkerError, match="model gone"):
+            await client.process_news("boom")
+        with pytest.raises(FilterWorkerError, match="no channels"):
+            await client.filter_batch(["кража"])
+        # the connection stays usable
+        assert await client.process_news("кража") == (True, "кража")
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_only_idempotent_requests_are_resent(tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    received = []
+
+    async def handle(reader, writer):
+        # reads one request; drops the connection the first time
+        header = await reader.readexactly(REQUEST_HEADER.size)
+        op, length = REQUEST_HEADER.unpack(header)
+        await reader.readexactly(length)
+        received.append(op)
+        if len(received) > 1:
+            writer.write(encode_result(True, None))
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    client = FilterWorkerClient(socket_path)
+    try:
+        # the worker may have filtered it, so asking again could reject it
+        with pytest.raises(asyncio.IncompleteReadError):
+            await client.process_news("кража")
+        assert len(received) == 1
+
+        received.clear()
+        await client.forget(["кража"], 0)
+        assert len(received) == 2
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
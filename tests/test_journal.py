@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from newsreposter.services.journal import GroupCommitJournal
+from newsreposter.services.news_queue import FileQueue
+
+
+@pytest.mark.asyncio
+async def test_concurrent_commits_share_one_fsync(tmp_path):
+    journal = GroupCommitJournal(tmp_path / "journal.log", window_seconds=0.01)
+    await asyncio.gather(
+        *(journal.commit([{"op": "state", "state": {"n": i}}]) for i in range(5))
+    )
+    assert journal.syncs == 1
+    assert [r["state"]["n"] for r in journal.replay()] == list(range(5))
+
+    journal.checkpoint()
+    assert journal.replay() == []
+    await journal.close()
+
+
+@pytest.mark.asyncio
+async def test_close_does_not_block_the_event_loop(tmp_path, monkeypatch):
+    import time
+
+    from newsreposter.services import journal as journal_mod
+
+    monkeypatch.setattr(journal_mod.os, "sync", lambda: time.sleep(0.2))
+    journal = GroupCommitJournal(tmp_path / "journal.log")
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    await journal.close()
+    ticker.cancel()
+    assert ticks > 5
+
+
+@pytest.mark.asyncio
+async def test_file_queue_restores_unsynced_items_from_journal(tmp_path):
+    journal = GroupCommitJournal(tmp_path / "journal.log")
+    q = FileQueue(tmp_path / "q", journal=journal)
+    await q.put_many([{"title": "lost"}, {"title": "posted"}])
+    claimed = q.claim_one()
+    assert claimed is not None and q.read(claimed)["title"] == "lost"
+    claimed2 = q.claim_one()
+    q.remove(claimed2)
+    await q.flush()
+    # the crash took the unsynced claimed file with it
+    claimed.unlink()
+
+    restored = FileQueue(tmp_path / "q", journal=GroupCommitJournal(journal.path))
+    assert [restored.read(p)["title"] for p in restored.pending()] == ["lost"]
+
+
+@pytest.mark.asyncio
+async def test_journal_replay_leaves_retried_items_alone(tmp_path):
+    journal = GroupCommitJournal(tmp_path / "journal.log")
+    q = FileQueue(tmp_path / "q", journal=journal)
+    await q.put_many([{"title": "flaky"}])
+    q.retry_later(q.claim_one(), 2**62)
+
+    restored = FileQueue(tmp_path / "q", journal=GroupCommitJournal(journal.path))
+    assert list(restored.pending()) == []
+    assert len(list(restored.retry.iterdir())) == 1
+
+
+@pytest.mark.asyncio
+async def test_journal_replay_leaves_expired_items_alone(tmp_path):
+    journal = GroupCommitJournal(tmp_path / "journal.log")
+    q = FileQueue(tmp_path / "q", journal=journal)
+    await q.put_many([{"title": "old", "expires_ms": 1}])
+    assert q.expire_stale() == 1
+
+    restored = FileQueue(tmp_path / "q", journal=GroupCommitJournal(journal.path))
+    assert list(restored.pending()) == []
+    assert len(list(restored.expired.iterdir())) == 1
+
+
+@pytest.mark.asyncio
+async def test_poster_makes_removes_durable(tmp_path):
+    from newsreposter.services.news_queue import QueuePoster
+
+    journal = GroupCommitJournal(tmp_path / "journal.log")
+    q = FileQueue(tmp_path / "q", journal=journal)
+    await q.put_many([{"title": "posted"}])
+
+    async def post(item):
+        pass
+
+    assert await QueuePoster(q, post)._process_once() == 1
+    records = GroupCommitJournal(journal.path).replay()
+    assert [r["op"] for r in records] == ["enqueue", "remove"]
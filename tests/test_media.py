@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from newsreposter.core import media
+from newsreposter.core.cache import PersistentLRUCache
+
+
+@pytest_asyncio.fixture
+async def media_server(monkeypatch):
+    monkeypatch.setattr(media, "CHECK_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(
+        media, "_check_cache", PersistentLRUCache(None, max_size=100)
+    )
+    heads = []
+
+    async def handle(request):
+        heads.append(request.path)
+        name = request.match_info["name"]
+        if name == "missing.jpg":
+            raise web.HTTPNotFound()
+        if name == "busy.jpg":
+            raise web.HTTPServiceUnavailable()
+        if name == "slow.jpg":
+            await asyncio.sleep(2)
+        if name == "page.jpg":
+            return web.Response(text="<html></html>", content_type="text/html")
+        size = 6 * 1024 * 1024 if name == "huge.jpg" else 1024
+        return web.Response(body=b"x" * size, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_route("*", "/{name}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    yield f"http://127.0.0.1:{port}", heads
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_validate_media_drops_broken_urls(media_server):
+    base, heads = media_server
+    names = [
+        "ok.jpg",
+        "missing.jpg",
+        "huge.jpg",
+        "page.jpg",
+        "slow.jpg",
+        "known.jpg",
+        "busy.jpg",
+    ]
+    urls = [f"{base}/{n}" for n in names]
+
+    kept = await media.validate_media(urls, media.PHOTO, trusted={urls[5]})
+    # slow.jpg timed out and busy.jpg got a 503: unknown, left to Telegram
+    assert kept == [urls[0], urls[4], urls[5], urls[6]]
+    assert "/known.jpg" not in heads
+
+    heads.clear()
+    assert await media.validate_media(urls[:4], media.PHOTO) == [urls[0]]
+    assert heads == []
+    # a server error is not remembered
+    assert await media.validate_media([urls[6]], media.PHOTO) == [urls[6]]
+    assert heads == ["/busy.jpg"]
+    # a video may be larger than a photo
+    assert await media.validate_media([urls[2]], media.VIDEO) == [urls[2]]
+
+
+@pytest.mark.asyncio
+async def test_prepare_stores_checked_media(media_server, monkeypatch):
+    from newsreposter.core import post
+
+    base, heads = media_server
+    cache = PersistentLRUCache(None, max_size=10)
+    cache.put(f"{base}/known.jpg", "id-1")
+    monkeypatch.setattr(post, "_file_id_cache", cache)
+    photos = [f"{base}/{n}" for n in ("ok.jpg", "missing.jpg", "known.jpg")]
+    item = {"link": "https://ria.ru/1", "post_data": {"photo": list(photos)}}
+
+    await post.prepare_post_item(item, check_media=False)
+    assert item["post_data"]["photo"] == photos
+    assert heads == []
+
+    await post.prepare_post_item(item)
+    assert item["post_data"]["photo"] == [photos[0], photos[2]]
+    assert item["post_data"]["video"] == []
+    assert sorted(heads) == ["/missing.jpg", "/ok.jpg"]
@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from newsreposter.core import metrics, parsers
+from newsreposter.core.parsers.pre_parsers import ria
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_percentiles_are_close():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(3, 1) for _ in range(10000)]
+    hist = metrics.Histogram()
+    for v in values:
+        hist.record(v)
+    values.sort()
+    for p in (50, 95, 99):
+        exact = values[int(len(values) * p / 100) - 1]
+        assert exact <= hist.percentile(p) <= exact * 1.07
+    assert hist.percentile(100) == max(values)
+    assert hist.count_le(values[-1] * 2) == len(values)
+
+
+def test_exported_bounds_are_counted_exactly():
+    hist = metrics.Histogram()
+    # 499 and 501 share a log-linear bucket that straddles 500
+    for v in (499, 500, 501, 5_000_000):
+        hist.record(v)
+    merged = metrics.Histogram()
+    merged.merge(hist)
+    assert merged.count_le(500) == 2
+    assert merged.count_le(1000) == 3
+    assert merged.count_le(3_600_000) == 3
+
+
+def test_spans_are_kept_per_stage_and_site(monkeypatch):
+    clock = iter([0.0, 0.010, 1.0, 1.030, 2.0, 2.500])
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(clock))
+    with metrics.span("fetch", "ria.ru"):
+        pass
+    with metrics.span("fetch", "tass.ru"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.span("send"):
+            raise ValueError
+
+    assert metrics.percentiles("fetch", "ria.ru")["p99"] == pytest.approx(10, 0.07)
+    assert metrics.percentiles("fetch")["count"] == 2
+    assert metrics.percentiles("send")["max"] == pytest.approx(500)
+    assert set(metrics.snapshot()) == {
+        ("fetch", "ria.ru"),
+        ("fetch", "tass.ru"),
+        ("send", ""),
+    }
+    assert "fetch" in metrics.report()
+
+
+def test_run_parser_labels_parse_stages(monkeypatch):
+    from newsreposter.core.parsers.post_parsers import parse_html, tass
+
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    site = parsers.site_label(ria.RIA_RSS)
+    parsers.run_parser(
+        ria.parse_items, b"<rss></rss>", None, stage="pre_parse", site=site
+    )
+    link = "https://www.tass.ru/1"
+    parsers.run_parser(
+        parse_html,
+        tass.parse,
+        "<html></html>",
+        link,
+        stage="post_parse",
+        site=parsers.site_label(link),
+    )
+    assert set(metrics.snapshot()) >= {
+        ("pre_parse", "ria.ru"),
+        ("post_parse", "tass.ru"),
+    }
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    with metrics.span("fetch"):
+        pass
+    assert metrics.snapshot() == {}
+
+
+def test_freshness_is_reported_over_a_rolling_window():
+    metrics.record_freshness("ria", 60_000, now=1000)
+    metrics.record_freshness("ria", 120_000, now=4000)
+    metrics.record_freshness("tass", 30_000, now=4000)
+
+    report = metrics.freshness(now=4100, window_seconds=3600)
+    assert report["ria"]["count"] == 2
+    assert report[""]["count"] == 3
+    later = metrics.freshness(now=4700, window_seconds=3600)
+    assert later["ria"]["count"] == 1
+    assert later["ria"]["max"] == 120_000
+    assert "tass" in metrics.freshness_report(now=4700)
+
+
+@pytest.mark.asyncio
+async def test_poster_records_freshness_per_source(tmp_path):
+    import time
+
+    from newsreposter.services.news_queue import FileQueue, QueuePoster
+
+    q = FileQueue(tmp_path / "q")
+    published = int(time.time() * 1000) - 90_000
+    q.enqueue(
+        {
+            "title": "t",
+            "link": "https://ria.ru/1",
+            "timestamp_ms": published,
+            "source": "ria",
+            "stages": {"fetched": published + 1, "enqueued": published + 2},
+        }
+    )
+    posted = []
+
+    async def post(item):
+        posted.append(item)
+
+    await QueuePoster(q, post)._process_once()
+    assert set(posted[0]["stages"]) == {"fetched", "enqueued", "claimed", "posted"}
+    assert 90_000 <= metrics.freshness()["ria"]["p50"] <= 90_000 * 1.07
+    assert metrics.percentiles("queued", "ria")["count"] == 1
@@ -0,0 +1,56 @@
+import aiohttp
+import pytest
+
+from newsreposter.core import metrics
+from newsreposter.services import metrics_server
+from newsreposter.services.metrics_server import MetricsServer
+from newsreposter.services.news_queue import FileQueue
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_prometheus_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_server, "LAG_INTERVAL_SECONDS", 0.01)
+    metrics.reset()
+    q = FileQueue(tmp_path / "q")
+    q.enqueue({"title": "a"})
+    q.enqueue({"title": "b"})
+    q.claim_one()
+    metrics.record("poll", 1500, "ria")
+    metrics.increment("polls", site="ria", outcome="ok")
+    metrics.increment("posts", 1234567, site="ria")
+    metrics.increment("bytes", 0.25)
+    metrics.record_post()
+
+    async def dedup_sizes():
+        return {"default": 3}
+
+    server = MetricsServer(
+        {"default": q},
+        caches={"seen_links": {"x": 1}},
+        port=0,
+        dedup_sizes=dedup_sizes,
+    )
+    await server.start()
+    try:
+        port = server._runner.addresses[0][1]  # type: ignore
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                assert resp.status == 200
+                assert resp.headers["Content-Type"] == metrics_server.CONTENT_TYPE
+                text = await resp.text()
+    finally:
+        await server.stop()
+        metrics.reset()
+
+    assert 'newsreposter_queue_depth{channel="default",state="new"} 1' in text
+    assert 'newsreposter_queue_depth{channel="default",state="in_progress"} 1' in text
+    assert 'newsreposter_cache_size{cache="seen_links"} 1' in text
+    assert 'newsreposter_cache_size{cache="dedup.default"} 3' in text
+    assert 'newsreposter_polls_total{outcome="ok",site="ria"} 1' in text
+    assert 'newsreposter_posts_total{site="ria"} 1234567' in text
+    assert "newsreposter_bytes_total 0.25" in text
+    assert "newsreposter_posts_per_minute 1" in text
+    assert 'stage_seconds_bucket{le="1",site="ria",stage="poll"} 0' in text
+    assert 'stage_seconds_bucket{le="5",site="ria",stage="poll"} 1' in text
+    assert 'stage_seconds_count{site="ria",stage="poll"} 1' in text
+    assert "# TYPE newsreposter_event_loop_lag_seconds gauge" in text
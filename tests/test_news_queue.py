@@ -0,0 +1,236 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from newsreposter.services import news_queue
+from newsreposter.services.news_queue import FileQueue, QueuePoster
+from newsreposter.services.prefetcher import ArticlePrefetcher
+
+
+def test_enqueue_claim_read_remove(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    q.enqueue({"title": "a", "link": "https://ria.ru/1"})
+    q.enqueue({"title": "b", "link": "https://ria.ru/2"})
+
+    claimed = q.claim_one()
+    assert claimed is not None
+    first = q.read(claimed)["title"]
+    q.remove(claimed)
+
+    claimed = q.claim_one()
+    assert claimed is not None
+    assert {first, q.read(claimed)["title"]} == {"a", "b"}
+    q.mark_failed(claimed)
+    assert q.claim_one() is None
+    assert len(list(q.failed.iterdir())) == 1
+
+
+def test_prefetched_data_travels_with_item(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    path = q.enqueue({"title": "a", "link": "https://ria.ru/1"})
+    assert q.attach_post_data(path, {"description": ["text"]})
+
+    claimed = q.claim_one()
+    assert claimed is not None
+    assert q.read(claimed)["post_data"] == {"description": ["text"]}
+    q.remove(claimed)
+    assert not list(q.prefetched.iterdir())
+
+
+def test_prefetch_for_removed_item_is_dropped(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    path = q.enqueue({"title": "a", "link": "https://ria.ru/1"})
+    claimed = q.claim_one()
+    assert claimed is not None
+    q.remove(claimed)
+    assert not q.attach_post_data(path, {"description": ["text"]})
+    assert not list(q.prefetched.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_prefetcher_bounds_concurrency_and_stores_results(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    running = 0
+    peak = 0
+
+    async def fetch(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"description": [item["title"]]}
+
+    prefetcher = ArticlePrefetcher(q, fetch, max_concurrency=2)
+    for i in range(5):
+        item = {"title": f"t{i}", "link": f"https://ria.ru/{i}"}
+        prefetcher.submit(q.enqueue(item), item)
+    await asyncio.gather(*prefetcher._tasks)
+
+    assert peak == 2
+    assert all(q.has_post_data(p) for p in q.pending())
+    await prefetcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_poster_prepares_concurrently_and_publishes_in_order(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    titles = [f"t{i}" for i in range(5)]
+    for title in titles:
+        q.enqueue({"title": title, "link": f"https://ria.ru/{title}"})
+        await asyncio.sleep(0.002)  # distinct enqueue timestamps
+    running = 0
+    peak = 0
+    published = []
+
+    async def prepare(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # later items finish preparing first
+        await asyncio.sleep(0.01 * (5 - int(item["title"][1:])))
+        running -= 1
+
+    async def post(item):
+        published.append(item["title"])
+
+    poster = QueuePoster(q, post, max_per_run=None, prepare_cb=prepare, max_in_flight=3)
+    assert await poster._process_once() == 5
+    assert published == titles
+    assert peak == 3
+    assert not list(q.pending())
+
+
+@pytest.mark.asyncio
+async def test_unreadable_item_does_not_stall_later_posts(tmp_path):
+    class BrokenRead(FileQueue):
+        def read(self, path):
+            item = super().read(path)
+            if item["title"] == "t1":
+                raise ValueError("corrupt")
+            return item
+
+    q = BrokenRead(tmp_path / "q")
+    titles = [f"t{i}" for i in range(4)]
+    for title in titles:
+        q.enqueue({"title": title, "link": f"https://ria.ru/{title}"})
+        await asyncio.sleep(0.002)
+    published = []
+
+    async def prepare(item):
+        # t0 is still preparing when t1's read fails
+        await asyncio.sleep(0.05 if item["title"] == "t0" else 0)
+
+    async def post(item):
+        published.append(item["title"])
+
+    poster = QueuePoster(q, post, max_per_run=None, prepare_cb=prepare, max_in_flight=4)
+    assert await asyncio.wait_for(poster._process_once(), 5) == 3
+    assert published == ["t0", "t2", "t3"]
+    assert len(list(q.failed.iterdir())) == 1
+
+
+def test_claims_follow_enqueue_order_within_one_millisecond(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    for i in range(20):
+        q.enqueue({"title": f"t{i}"})
+    claimed = [q.read(q.claim_one())["title"] for _ in range(20)]
+    assert claimed == [f"t{i}" for i in range(20)]
+
+
+def test_index_is_rebuilt_and_picks_up_external_writers(tmp_path, monkeypatch):
+    writer = FileQueue(tmp_path / "q")
+    writer.enqueue({"title": "a"})
+    q = FileQueue(tmp_path / "q")  # startup scan
+    assert [q.read(p)["title"] for p in q.pending()] == ["a"]
+    assert q.claim_one() is not None
+
+    writer.enqueue({"title": "b"})
+    monkeypatch.setattr(news_queue, "RESCAN_INTERVAL_SECONDS", 0)
+    claimed = q.claim_one()
+    assert claimed is not None and q.read(claimed)["title"] == "b"
+    assert writer.claim_one() is None  # stale index entry is skipped
+
+
+def test_stranded_items_are_requeued_with_attempt_count(tmp_path):
+    other_host = FileQueue(tmp_path / "q", owner="elsewhere:1:x")
+    other_host.enqueue({"title": "a"})
+    claimed = other_host.claim_one()
+    assert other_host.attempts(claimed) == 1
+
+    # we cannot tell whether a claimer on another host is alive: wait for the lease
+    q = FileQueue(tmp_path / "q", lease_seconds=60, max_attempts=2)
+    assert q.requeue_stranded() == 0
+    q = FileQueue(tmp_path / "q", lease_seconds=0, max_attempts=2)
+    assert q.requeue_stranded() == 1
+
+    # an earlier run of this process is gone for sure
+    earlier = f"{socket.gethostname()}:{os.getpid()}:0"
+    crashed = FileQueue(tmp_path / "q", owner=earlier, max_attempts=2)
+    claimed = crashed.claim_one()
+    assert crashed.attempts(claimed) == 2
+    q = FileQueue(tmp_path / "q", max_attempts=2)
+    assert q.requeue_stranded() == 0
+    assert [p.name for p in q.failed.iterdir()] == [claimed.name]
+
+
+def test_queues_in_one_process_share_the_owner(tmp_path):
+    from newsreposter.services.news_queue import make_owner, owner_is_dead
+
+    poster = FileQueue(tmp_path / "q", lease_seconds=60)
+    poster.enqueue({"title": "a"})
+    assert poster.claim_one() is not None
+    # e.g. the checker's queue on the same directory
+    other = FileQueue(tmp_path / "q", lease_seconds=60)
+    assert other.owner == poster.owner == make_owner()
+    assert other.requeue_stranded() == 0
+
+    host, parent = socket.gethostname(), os.getppid()
+    start = news_queue.process_start(parent)
+    assert not owner_is_dead(f"{host}:{parent}:{start}", make_owner())
+    # a live pid that now belongs to a later process
+    assert owner_is_dead(f"{host}:{parent}:{int(start) + 1}", make_owner())
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_claims_highest_priority_unexpired_first(tmp_path, backend):
+    import time
+
+    from newsreposter.services.sqlite_queue import SqliteQueue
+
+    if backend == "file":
+        q = FileQueue(tmp_path / "q")
+    else:
+        q = SqliteQueue(tmp_path / "q.db")
+    now = int(time.time() * 1000)
+    q.enqueue({"title": "relevant", "priority": 0.85, "expires_ms": now + 60_000})
+    q.enqueue({"title": "stale", "priority": 1.5, "expires_ms": now - 1})
+    q.enqueue({"title": "keyword", "priority": 1.1, "expires_ms": now + 60_000})
+    q.enqueue({"title": "keyword, later", "priority": 1.1})
+
+    claimed = []
+    while (ref := q.claim_one()) is not None:
+        claimed.append(q.read(ref)["title"])
+    assert claimed == ["keyword", "keyword, later", "relevant"]
+    if backend == "file":
+        assert len(list(q.expired.iterdir())) == 1
+
+
+def test_expire_stale_archives_in_bulk(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    for i in range(3):
+        q.enqueue({"title": f"old{i}", "expires_ms": 1})
+    q.enqueue({"title": "fresh"})
+    assert q.expire_stale() == 3
+    assert [q.read(p)["title"] for p in q.pending()] == ["fresh"]
+
+
+def test_item_priority():
+    from newsreposter.services.news_checker import item_priority
+
+    assert item_priority("суд,арест", "ria") == 1.2
+    assert item_priority(0.83, "ria") == 0.83
+    assert item_priority(0.83, "fsb", {"fsb": 0.5}) == 1.33
+    assert item_priority("суд", "ria") > item_priority(0.99, "ria")
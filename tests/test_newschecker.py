@@ -19,18 +19,32 @@ def now_ms():
     return int(datetime.now(timezone.utc).timestamp() * 1000)
 
 
+def make_checker(tmp_path):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.news_queue import FileQueue
+
+    async def news_filter(text: str):
+        return False, None
+
+    return NewsChecker(
+        q=FileQueue(tmp_path / "queue"),
+        news_filter=news_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+    )
+
+
 @pytest.mark.asyncio
 async def test_sync_parser_updates_state(tmp_path, monkeypatch):
     state_file = tmp_path / "state.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     # sync parser
     base = now_ms()
 
-    def sync_parser(ms: int):
+    def sync_parser(milliseconds: int):
         # returns one item with timestamp base - 5000
-        return [{"timestamp_ms": base - 5000, "link": "http://a/1"}]
+        return [{"title": "t", "timestamp_ms": base - 5000, "link": "http://a/1"}]
 
     chk.parsers = {"a": sync_parser}
     chk.site_names = ["a"]
@@ -48,12 +62,12 @@ async def test_async_parser_updates_state(tmp_path, monkeypatch):
     state_file = tmp_path / "state2.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     base = now_ms()
 
-    async def async_parser(ms: int):
+    async def async_parser(milliseconds: int):
         await asyncio.sleep(0)  # ensure it's coroutine
-        return [{"timestamp_ms": base - 2000, "link": "http://b/1"}]
+        return [{"title": "t", "timestamp_ms": base - 2000, "link": "http://b/1"}]
 
     chk.parsers = {"b": async_parser}
     chk.site_names = ["b"]
@@ -71,9 +85,9 @@ async def test_empty_items_sets_now(tmp_path, monkeypatch):
     state_file = tmp_path / "state3.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
 
-    async def empty_parser(ms: int):
+    async def empty_parser(milliseconds: int):
         return []
 
     chk.parsers = {"c": empty_parser}
@@ -94,11 +108,11 @@ async def test_parser_exception_does_not_update_last_checked(tmp_path, monkeypat
     state_file = tmp_path / "state4.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     # set previous last_checked
     initial_last = now_ms() - 10000
 
-    async def bad_parser(ms: int):
+    async def bad_parser(milliseconds: int):
         raise RuntimeError("boom")
 
     chk.parsers = {"d": bad_parser}
@@ -116,14 +130,14 @@ async def test_duplicate_timestamps_handle(tmp_path, monkeypatch):
     state_file = tmp_path / "state5.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     base = now_ms()
 
-    async def dup_parser(ms: int):
+    async def dup_parser(milliseconds: int):
         # two items with identical timestamp
         return [
-            {"timestamp_ms": base - 3000, "link": "http://dup/1"},
-            {"timestamp_ms": base - 3000, "link": "http://dup/2"},
+            {"title": "t", "timestamp_ms": base - 3000, "link": "http://dup/1"},
+            {"title": "t", "timestamp_ms": base - 3000, "link": "http://dup/2"},
         ]
 
     chk.parsers = {"e": dup_parser}
@@ -140,14 +154,14 @@ async def test_rotation_over_multiple_sites(tmp_path, monkeypatch):
     state_file = tmp_path / "state6.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     base = now_ms()
 
-    async def p1(ms):
-        return [{"timestamp_ms": base - 1000}]
+    async def p1(milliseconds: int):
+        return [{"title": "t", "timestamp_ms": base - 1000}]
 
-    async def p2(ms):
-        return [{"timestamp_ms": base - 2000}]
+    async def p2(milliseconds: int):
+        return [{"title": "t", "timestamp_ms": base - 2000}]
 
     chk.parsers = {"s1": p1, "s2": p2}
     chk.site_names = ["s1", "s2"]
@@ -168,16 +182,16 @@ async def test_concurrent_checks_are_serialized(tmp_path, monkeypatch):
     state_file = tmp_path / "state7.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     base = now_ms()
     event = asyncio.Event()
     call_count = {"n": 0}
 
-    async def slow_parser(ms: int):
+    async def slow_parser(milliseconds: int):
         call_count["n"] += 1
         # wait so the second check_news() will attempt to acquire lock
         await event.wait()
-        return [{"timestamp_ms": base - 500}]
+        return [{"title": "t", "timestamp_ms": base - 500}]
 
     chk.parsers = {"slow": slow_parser}
     chk.site_names = ["slow"]
@@ -205,14 +219,14 @@ async def test_ignores_bad_item_entries(tmp_path, monkeypatch):
     state_file = tmp_path / "state8.json"
     monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
 
-    chk = NewsChecker()
+    chk = make_checker(tmp_path)
     base = now_ms()
 
-    async def mixed_parser(ms: int):
+    async def mixed_parser(milliseconds: int):
         # first item malformed (no timestamp), second valid
         return [
-            {"link": "bad"},
-            {"timestamp_ms": base - 700, "link": "ok"},
+            {"title": "t", "link": "bad"},
+            {"title": "t", "timestamp_ms": base - 700, "link": "ok"},
         ]
 
     chk.parsers = {"m": mixed_parser}
@@ -222,3 +236,219 @@ async def test_ignores_bad_item_entries(tmp_path, monkeypatch):
     await chk.check_news()
     data = json.loads(state_file.read_text(encoding="utf-8"))
     assert data["sites"]["m"]["last_checked"] == (base - 700) + 1
+
+
+@pytest.mark.asyncio
+async def test_same_link_is_filtered_once(tmp_path, monkeypatch):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.news_queue import FileQueue
+
+    state_file = tmp_path / "state9.json"
+    monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
+    filtered = []
+
+    async def news_filter(text: str):
+        filtered.append(text)
+        return True, "kw"
+
+    chk = NewsChecker(
+        q=FileQueue(tmp_path / "queue"),
+        news_filter=news_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+    )
+    base = now_ms()
+
+    async def parser(milliseconds: int):
+        return [
+            {"title": "a", "timestamp_ms": base - 900, "link": "https://www.ria.ru/1/"},
+            {
+                "title": "a",
+                "timestamp_ms": base - 800,
+                "link": "http://ria.ru/1?utm_source=x",
+            },
+        ]
+
+    chk.parsers = {"r": parser}
+    chk.site_names = ["r"]
+    chk.state = {"index": 0, "sites": {"r": {"last_checked": None}}}
+
+    await chk.check_news()
+    assert filtered == ["a"]
+    assert len(list(chk.queue.pending())) == 1
+    data = json.loads(state_file.read_text(encoding="utf-8"))
+    assert data["sites"]["r"]["last_checked"] == (base - 800) + 1
+
+
+@pytest.mark.asyncio
+async def test_one_filter_pass_fans_out_to_channels(tmp_path, monkeypatch):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.news_queue import FileQueue
+
+    state_file = tmp_path / "state10.json"
+    monkeypatch.setattr(news_mod, "STATE_FILE", str(state_file))
+    batches = []
+
+    async def batch_filter(texts):
+        batches.append(texts)
+        return [[(True, "kw"), (t == "b", 0.9)] for t in texts]
+
+    targets = [
+        news_mod.ChannelTarget("crime", FileQueue(tmp_path / "crime")),
+        news_mod.ChannelTarget("city", FileQueue(tmp_path / "city")),
+    ]
+    chk = NewsChecker(
+        targets=targets,
+        batch_filter=batch_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+    )
+    base = now_ms()
+
+    async def parser(milliseconds: int):
+        return [
+            {"title": "a", "timestamp_ms": base - 900, "link": "https://ria.ru/1"},
+            {"title": "b", "timestamp_ms": base - 800, "link": "https://ria.ru/2"},
+        ]
+
+    chk.parsers = {"r": parser}
+    chk.site_names = ["r"]
+    chk.state = {"index": 0, "sites": {"r": {"last_checked": None}}}
+
+    await chk.check_news()
+    assert batches == [["a", "b"]]
+    crime, city = (t.queue for t in targets)
+    assert [crime.read(r)["title"] for r in crime.pending()] == ["a", "b"]
+    assert [city.read(r)["title"] for r in city.pending()] == ["b"]
+    assert city.read(next(iter(city.pending())))["priority"] == 0.9
+    queued = city.read(next(iter(city.pending())))
+    assert queued["source"] == "r"
+    assert set(queued["stages"]) == {"fetched", "filtered", "enqueued"}
+
+    await chk.check_news()
+    assert len(batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_item_ttl_counts_from_fetch_not_publication(tmp_path, monkeypatch):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.news_queue import FileQueue
+
+    monkeypatch.setattr(news_mod, "STATE_FILE", str(tmp_path / "state11.json"))
+
+    async def news_filter(text: str):
+        return True, "kw"
+
+    chk = NewsChecker(
+        q=FileQueue(tmp_path / "queue"),
+        news_filter=news_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+        item_ttl_ms=60 * 60 * 1000,
+    )
+    base = now_ms()
+
+    async def parser(milliseconds: int):
+        # date-only sources stamp items with midnight
+        return [{"title": "a", "timestamp_ms": base - 20 * 60 * 60 * 1000, "link": "x"}]
+
+    chk.parsers = {"fsb": parser}
+    chk.site_names = ["fsb"]
+    chk.state = {"index": 0, "sites": {"fsb": {"last_checked": None}}}
+
+    await chk.check_news()
+    assert chk.queue.claim_one() is not None
+
+
+@pytest.mark.asyncio
+async def test_failed_enqueue_is_retried_past_the_dedup_cache(tmp_path, monkeypatch):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.news_queue import FileQueue
+
+    monkeypatch.setattr(news_mod, "STATE_FILE", str(tmp_path / "state12.json"))
+    seen = set()
+
+    async def news_filter(text: str):
+        # like process_news: an accepted title is remembered as a duplicate
+        if text in seen:
+            return False, "Text hash already in cache"
+        seen.add(text)
+        return True, "kw"
+
+    async def forget(texts, channel):
+        seen.difference_update(texts)
+
+    class FlakyQueue(FileQueue):
+        fail = True
+
+        async def put_many(self, items):
+            if self.fail:
+                self.fail = False
+                raise OSError("disk full")
+            return await super().put_many(items)
+
+    chk = NewsChecker(
+        q=FlakyQueue(tmp_path / "queue"),
+        news_filter=news_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+        forget=forget,
+    )
+    base = now_ms()
+
+    async def parser(milliseconds: int):
+        return [{"title": "a", "timestamp_ms": base - 900, "link": "https://ria.ru/1"}]
+
+    chk.parsers = {"r": parser}
+    chk.site_names = ["r"]
+    chk.state = {"index": 0, "sites": {"r": {"last_checked": None}}}
+
+    await chk.check_news()
+    assert chk.state["sites"]["r"]["last_checked"] is None
+    assert not list(chk.queue.pending())
+
+    await chk.check_news()
+    assert [chk.queue.read(r)["title"] for r in chk.queue.pending()] == ["a"]
+    assert chk.state["sites"]["r"]["last_checked"] == (base - 900) + 1
+
+
+@pytest.mark.asyncio
+async def test_undecided_items_are_filtered_again(tmp_path, monkeypatch):
+    from newsreposter.core.cache import PersistentLRUCache
+    from newsreposter.services.filter_worker import FilterWorkerError
+    from newsreposter.services.news_queue import FileQueue
+
+    monkeypatch.setattr(news_mod, "STATE_FILE", str(tmp_path / "state13.json"))
+    worker_down = True
+    filtered = []
+
+    async def news_filter(text: str):
+        if text == "b" and worker_down:
+            raise FilterWorkerError("Filter worker error: model gone")
+        filtered.append(text)
+        return True, "kw"
+
+    chk = NewsChecker(
+        q=FileQueue(tmp_path / "queue"),
+        news_filter=news_filter,
+        seen_links=PersistentLRUCache(None, max_size=100),
+    )
+    base = now_ms()
+
+    async def parser(milliseconds: int):
+        return [
+            {"title": "a", "timestamp_ms": base - 900, "link": "https://ria.ru/1"},
+            {"title": "b", "timestamp_ms": base - 800, "link": "https://ria.ru/2"},
+        ]
+
+    chk.parsers = {"r": parser}
+    chk.site_names = ["r"]
+    chk.state = {"index": 0, "sites": {"r": {"last_checked": None}}}
+
+    await chk.check_news()
+    assert filtered == ["a"]
+    assert news_mod.url_key("https://ria.ru/1") in chk.seen_links
+    assert news_mod.url_key("https://ria.ru/2") not in chk.seen_links
+    assert chk.state["sites"]["r"]["last_checked"] is None
+
+    worker_down = False
+    await chk.check_news()
+    assert filtered == ["a", "b"]
+    assert [chk.queue.read(r)["title"] for r in chk.queue.pending()] == ["a", "b"]
+    assert chk.state["sites"]["r"]["last_checked"] == (base - 800) + 1
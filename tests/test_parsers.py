@@ -0,0 +1,139 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+from newsreposter.core import parsers
+from newsreposter.core.parsers.pre_parsers import ria
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def ria_cutoff() -> datetime.datetime:
+    return datetime.datetime(2025, 10, 19, 11, 0, tzinfo=parsers.MOSCOW_TZ)
+
+
+def test_ria_parse_items_respects_cutoff():
+    content = (FIXTURES / "ria.xml").read_bytes()
+    items = ria.parse_items(content, ria_cutoff())
+    assert [it["link"] for it in items] == [
+        "https://ria.ru/20251019/zaderzhanie-2049000001.html",
+        "https://ria.ru/20251019/diversiya-2049000000.html",
+    ]
+    assert items[1]["title"] == "ФСБ предотвратила диверсию «на железной дороге»"
+
+
+@pytest.fixture
+def parse_pool():
+    parsers.configure_parse_pool(1, log_level="WARNING")
+    yield
+    parsers.shutdown_parse_pool()
+
+
+def test_run_parser_in_process_pool(parse_pool):
+    content = (FIXTURES / "ria.xml").read_bytes()
+    expected = ria.parse_items(content, ria_cutoff())
+    parsed = parsers.run_parser(
+        ria.parse_items, content, ria_cutoff(), stage="pre_parse"
+    )
+    assert parsed == expected
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_post_parser_regions_match_full_tree(backend):
+    from newsreposter.core.parsers.post_parsers import parse_html, tass
+
+    content = (FIXTURES / "tass_article.html").read_bytes()
+    link = "https://tass.ru/proisshestviya/1"
+    parsers.set_html_parser(backend)
+    try:
+        full = parse_html(tass.parse, content, link)
+        strained = parse_html(tass.parse, content, link, tass.PARSE_ONLY)
+    finally:
+        parsers.set_html_parser("html.parser")
+    assert strained == full
+    assert full["photo"] == ["https://tass.ru/media/photo1.jpg"]
+    assert full["video"] == ["https://cdn.tass.ru/video1.mp4"]
+
+
+def test_iter_rss_items_matches_full_parse():
+    import xml.etree.ElementTree as ET
+
+    content = (FIXTURES / "ria.xml").read_bytes()
+    expected = [it.findtext("link") for it in ET.fromstring(content).findall(".//item")]
+    for chunk_size in (7, 64, 1 << 16):
+        links = [
+            it.findtext("link")
+            for it in parsers.iter_rss_items(content, chunk_size=chunk_size)
+        ]
+        assert links == expected
+    text = content.decode("utf-8")
+    assert [it.findtext("link") for it in parsers.iter_rss_items(text)] == expected
+
+
+def test_iter_rss_items_stops_early():
+    content = (FIXTURES / "ria.xml").read_bytes()
+    items = parsers.iter_rss_items(content, chunk_size=64)
+    first = next(items)
+    assert first.findtext("title").startswith("В Москве")
+    items.close()
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (
+            "HTTPS://WWW.Ria.ru:443/a/b/?utm_source=tg&id=2&from=rss#comments",
+            "https://www.ria.ru/a/b/?id=2&from=rss",
+        ),
+        ("https://tass.ru/politika/1?a=%20b", "https://tass.ru/politika/1?a=%20b"),
+        ("fsb/press/message/single.htm!id=1", "http://www.fsb.ru/fsb/press/message/single.htm!id=1"),
+        ("", ""),
+    ],
+)
+def test_canonicalize_url(url, expected):
+    base = "http://www.fsb.ru/" if url.startswith("fsb") else None
+    assert parsers.canonicalize_url(url, base=base) == expected
+
+
+def test_url_key_collapses_variants():
+    variants = [
+        "https://www.interfax-russia.ru/news/1",
+        "http://interfax-russia.ru/news/1/",
+        "https://interfax-russia.ru/news/1?utm_medium=rss#top",
+        "https://interfax-russia.ru/news/1?from=rss&fbclid=x",
+    ]
+    assert len({parsers.url_key(u) for u in variants}) == 1
+    assert parsers.url_key("https://мвд.рф/news/item/1") == parsers.url_key(
+        "https://xn--b1aew.xn--p1ai/news/item/1/"
+    )
+
+
+@pytest.mark.parametrize(
+    "link, parser",
+    [
+        ("https://ria.ru/20251019/x.html", "ria"),
+        ("https://www.interfax-russia.ru/moscow/news/1", "interfax"),
+        ("https://мвд.рф/news/item/1", "mia"),
+        ("https://xn--b1aew.xn--p1ai/news/item/1", "mia"),
+        ("https://63.xn--b1aew.xn--p1ai/news/item/1", "mia"),
+        ("http://www.fsb.ru/fsb/press/message/single.htm", "fsb"),
+        ("https://example.com/news/1", None),
+        ("https://notria.ru/1", None),
+    ],
+)
+def test_post_parser_routing(link, parser):
+    from newsreposter.core.parsers import post_parsers
+
+    module = post_parsers.resolve(link)
+    assert (module.__name__.rsplit(".", 1)[-1] if module else None) == parser
+
+
+def test_unroutable_link_is_not_rendered(monkeypatch):
+    from newsreposter.core.parsers import post_parsers
+
+    def fail(*args, **kwargs):
+        raise AssertionError("rendered an unroutable link")
+
+    monkeypatch.setattr(post_parsers, "get_rendered_page", fail)
+    assert post_parsers.route("https://example.com/news/1") is None
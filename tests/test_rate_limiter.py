@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from newsreposter.core.rate_limiter import TelegramRateLimiter, TokenBucket
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated
+    assert bucket.wait_time(2, now) == 0
+    bucket.consume(2, now)
+    assert bucket.wait_time(1, now) == pytest.approx(0.5)
+    # oversized requests wait for a full bucket instead of forever
+    assert bucket.wait_time(5, now + 0.5) == pytest.approx(0.5)
+
+
+@pytest.mark.asyncio
+async def test_limiter_paces_chat_and_counts_media_groups():
+    limiter = TelegramRateLimiter(
+        global_per_second=1000, chat_per_minute=600, chat_burst=2
+    )
+    start = time.monotonic()
+    await limiter.acquire(1, cost=2)
+    await limiter.acquire(2, cost=2)  # other chats have their own bucket
+    assert time.monotonic() - start < 0.05
+    await limiter.acquire(1, cost=1)
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_limiter_honours_retry_after(monkeypatch):
+    limiter = TelegramRateLimiter(global_per_second=1000, chat_per_minute=6000)
+    delays = []
+    monkeypatch.setattr(
+        limiter, "retry_after", lambda chat_id, seconds: delays.append(seconds)
+    )
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=1, text="x"), message="flood", retry_after=3
+            )
+        return "ok"
+
+    assert await limiter.call(1, 1, send) == "ok"
+    assert delays == [3]
+
+    limiter.max_retries = 0
+    calls = 0
+    with pytest.raises(TelegramRetryAfter):
+        await limiter.call(1, 1, send)
+
+
+@pytest.mark.asyncio
+async def test_waiting_chat_does_not_block_other_chats():
+    limiter = TelegramRateLimiter(global_per_second=1000, chat_per_minute=6000)
+    limiter.retry_after(1, 0.5)
+    blocked = asyncio.create_task(limiter.acquire(1))
+    await asyncio.sleep(0)
+    start = time.monotonic()
+    await limiter.acquire(2)
+    assert time.monotonic() - start < 0.05
+    assert not blocked.done()
+    await blocked
+
+
+@pytest.mark.asyncio
+async def test_global_limit_is_shared_across_chats():
+    limiter = TelegramRateLimiter(global_per_second=20, chat_per_minute=6000)
+    limiter._global.tokens = 0
+    start = time.monotonic()
+    await asyncio.gather(limiter.acquire(1), limiter.acquire(2))
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from newsreposter.services.news_queue import FileQueue, QueuePoster
+from newsreposter.services.retry import RetryPolicy
+from newsreposter.services.sqlite_queue import SqliteQueue
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(base_seconds=10, factor=2, max_seconds=35)
+    assert [policy.delay(n, ConnectionError()) for n in (1, 2, 3)] == [10, 20, 35]
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "file":
+        return FileQueue(tmp_path / "q", max_attempts=2)
+    return SqliteQueue(tmp_path / "q.db", max_attempts=2)
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_back_off_then_dead_letter(queue):
+    queue.enqueue({"title": "flaky"})
+    calls = 0
+
+    async def post(item):
+        nonlocal calls
+        calls += 1
+        raise ConnectionError("network is down")
+
+    poster = QueuePoster(
+        queue, post, max_per_run=None, retry_policy=RetryPolicy(base_seconds=0.05)
+    )
+    assert await poster._process_once() == 0
+    # not eligible yet, so the next run has nothing to claim
+    assert await poster._process_once() == 0
+    assert calls == 1
+
+    time.sleep(0.06)
+    assert await poster._process_once() == 0
+    assert calls == 2
+    time.sleep(0.2)
+    assert queue.claim_one() is None  # dead-lettered after max_attempts
+
+
+@pytest.mark.asyncio
+async def test_permanent_failure_is_not_retried(tmp_path):
+    q = FileQueue(tmp_path / "q")
+    q.enqueue({"title": ""})
+
+    async def post(item):
+        raise ValueError("Item missing title")
+
+    poster = QueuePoster(q, post, max_per_run=None, retry_policy=RetryPolicy())
+    await poster._process_once()
+    assert len(list(q.failed.iterdir())) == 1
+    assert not list(q.retry.iterdir())
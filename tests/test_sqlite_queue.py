@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from newsreposter.services.news_queue import FileQueue, QueuePoster
+from newsreposter.services.sqlite_queue import (
+    SqliteQueue,
+    migrate_file_queue,
+    migrate_file_queue_dir,
+)
+
+
+def test_enqueue_many_claim_in_order(tmp_path):
+    q = SqliteQueue(tmp_path / "q.db")
+    ids = q.enqueue_many([{"title": t} for t in ("a", "b", "c")])
+    assert list(q.pending()) == ids
+
+    claimed = q.claim_one()
+    assert q.read(claimed)["title"] == "a"
+    q.remove(claimed)
+    claimed = q.claim_one()
+    assert q.read(claimed)["title"] == "b"
+    q.mark_failed(claimed)
+    assert not q.attach_post_data(claimed, {"description": ["x"]})
+
+    assert q.attach_post_data(ids[2], {"description": ["x"]})
+    assert q.has_post_data(ids[2])
+    claimed = q.claim_one()
+    assert q.read(claimed)["post_data"] == {"description": ["x"]}
+    assert q.claim_one() is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    # another process; claims of this process's own queues are never taken back
+    crashed = SqliteQueue(
+        tmp_path / "q.db", visibility_timeout=0.01, owner="elsewhere:1:x"
+    )
+    crashed.enqueue({"title": "a"})
+    assert crashed.claim_one() is not None
+    crashed.close()
+
+    q = SqliteQueue(tmp_path / "q.db", visibility_timeout=0.01)
+    time.sleep(0.02)
+    claimed = q.claim_one()
+    assert claimed is not None
+    assert q.read(claimed)["title"] == "a"
+
+
+def test_migrate_file_queue(tmp_path):
+    files = FileQueue(tmp_path / "files")
+    first = files.enqueue({"title": "a"})
+    files.attach_post_data(first, {"description": ["x"]})
+    time.sleep(0.002)
+    files.enqueue({"title": "b"})
+    time.sleep(0.002)
+    files.mark_failed(files.claim_one())  # "a" becomes a failed item
+    time.sleep(0.002)
+    files.enqueue({"title": "c"})
+    files.enqueue({"title": "d", "expires_ms": 1})
+    files.claim_one()  # "b"
+    retried = files.claim_one()
+    assert files.claim_one() is None  # "d" goes to the expired archive
+    files.retry_later(retried, 1)  # "c", due at once, after one attempt
+
+    q = SqliteQueue(tmp_path / "q.db", max_attempts=3)
+    assert migrate_file_queue(files, q) == 4
+    assert q.depths()["expired"] == 1
+    dirs = (files.new, files.in_progress, files.retry, files.failed, files.expired)
+    for d in dirs:
+        assert not list(d.iterdir())
+    assert not list(files.prefetched.iterdir())
+    assert not list(files.leases.iterdir())
+    assert [q.read(ref)["title"] for ref in q.pending()] == ["b"]
+
+    claimed = [q.claim_one(), q.claim_one()]
+    assert [q.read(ref)["title"] for ref in claimed] == ["b", "c"]
+    # "c" keeps the attempt it used before the switch
+    assert q.attempts(claimed[1]) == 2
+
+
+def test_file_queue_dir_is_migrated_once(tmp_path):
+    base = tmp_path / "files"
+    q = SqliteQueue(tmp_path / "q.db")
+    assert migrate_file_queue_dir(q, base) == 0
+    assert not base.exists()
+
+    FileQueue(base).enqueue({"title": "a"})
+    assert migrate_file_queue_dir(q, base) == 1
+    assert not base.exists()
+    assert migrate_file_queue_dir(q, base) == 0
+    assert [q.read(ref)["title"] for ref in q.pending()] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_poster_drains_sqlite_queue(tmp_path):
+    q = SqliteQueue(tmp_path / "q.db")
+    q.enqueue_many([{"title": t} for t in ("a", "b")])
+    published = []
+
+    async def post(item):
+        published.append(item["title"])
+
+    poster = QueuePoster(q, post, max_per_run=None)
+    assert await poster._process_once() == 2
+    assert published == ["a", "b"]
+    assert q.claim_one() is None
+
+
+def test_depths_count_items_per_state(tmp_path):
+    q = SqliteQueue(tmp_path / "q.db")
+    q.enqueue_many([{"title": t} for t in ("a", "b", "c")])
+    q.mark_failed(q.claim_one())
+    q.claim_one()
+    assert q.depths() == {
+        "new": 1,
+        "in_progress": 1,
+        "delayed": 0,
+        "failed": 1,
+        "expired": 0,
+    }